@@ -0,0 +1,77 @@
+"""Benchmarks parsing search results and store pages with each parser backend"""
+from argparse import ArgumentParser
+from timeit import timeit
+
+from bs4 import BeautifulSoup
+
+from conftest import FAKE_SEARCH_HTML, FAKE_STORE_PAGE_HTML, FAKE_DISCOUNTED_STORE_PAGE_HTML
+from extract_games import make_soup, parse_app_id_bs, parse_game_bs, parse_price_bs
+from extract_games import SearchResultsParser, TAGS_AND_PRICES_ONLY
+
+PARSERS = ["html.parser", "lxml"]
+
+
+def parse_store_page(html: str, parser: str, strained: bool) -> tuple:
+    """Parse tags and prices from a store page the way the pipeline does"""
+    soup = make_soup(html, TAGS_AND_PRICES_ONLY if strained else None, parser)
+    return parse_game_bs(soup), parse_price_bs(soup)
+
+
+def parse_search_page_streamed(html: str, chunk_size: int = 16384) -> list[dict]:
+    """Parse search results a chunk at a time, the way the crawl does as they download"""
+    parser = SearchResultsParser()
+    games = []
+    for start in range(0, len(html), chunk_size):
+        parser.feed(html[start:start + chunk_size])
+        games.extend(parser.collect_games())
+    parser.close()
+    return games + parser.collect_games()
+
+
+def parse_search_page_unstrained(html: str) -> list[dict]:
+    """Parse search results the way the pipeline used to, building the full tree"""
+    soup = BeautifulSoup(html, "html.parser")
+    return [{"app_id": game.attrs['data-ds-appid'],
+             "title": game.find('span', class_='title').text,
+             "release_date": game.find(
+                 'div', class_="col search_released responsive_secondrow").text}
+            for game in soup.find_all("a", class_="search_result_row ds_collapse_flag")]
+
+
+if __name__ == "__main__":
+    arguments = ArgumentParser(description=__doc__)
+    arguments.add_argument("--repeat", type=int, default=200)
+    arguments.add_argument("--results-per-page", type=int, default=50)
+    arguments.add_argument("--surrounding-markup", type=int, default=40,
+                           help="copies of store page markup standing in for the "
+                                "navigation and scripts around the search results")
+    args = arguments.parse_args()
+
+    surrounding_markup = FAKE_STORE_PAGE_HTML * (args.surrounding_markup // 2)
+    search_page = (surrounding_markup + FAKE_SEARCH_HTML * args.results_per_page
+                   + surrounding_markup)
+    expected_games = parse_search_page_unstrained(search_page)
+    baseline = timeit(lambda: parse_search_page_unstrained(search_page), number=args.repeat)
+    print(f"Search page, html.parser full tree: {baseline / args.repeat * 1000:.2f} ms")
+    for parser in PARSERS:
+        assert parse_app_id_bs(search_page, parser) == expected_games
+        seconds = timeit(lambda: parse_app_id_bs(search_page, parser), number=args.repeat)
+        print(f"Search page, {parser} strained: {seconds / args.repeat * 1000:.2f} ms "
+              f"({baseline / seconds:.1f}x)")
+    assert parse_search_page_streamed(search_page) == expected_games
+    seconds = timeit(lambda: parse_search_page_streamed(search_page), number=args.repeat)
+    print(f"Search page, lxml streamed: {seconds / args.repeat * 1000:.2f} ms "
+          f"({baseline / seconds:.1f}x)")
+
+    for name, store_page in [("Store page", FAKE_STORE_PAGE_HTML),
+                             ("Discounted store page", FAKE_DISCOUNTED_STORE_PAGE_HTML)]:
+        expected = parse_store_page(store_page, "html.parser", strained=False)
+        baseline = timeit(lambda: parse_store_page(store_page, "html.parser", False),
+                          number=args.repeat)
+        print(f"{name}, html.parser full tree: {baseline / args.repeat * 1000:.2f} ms")
+        for parser in PARSERS:
+            assert parse_store_page(store_page, parser, strained=True) == expected
+            seconds = timeit(lambda: parse_store_page(store_page, parser, True),
+                             number=args.repeat)
+            print(f"{name}, {parser} strained: {seconds / args.repeat * 1000:.2f} ms "
+                  f"({baseline / seconds:.1f}x)")
@@ -3,10 +3,8 @@ import pytest
 import pandas as pd
 
 
-@pytest.fixture
-def fake_html() -> str:
-    """Fake html scraping for testing"""
-    return """<a class="search_result_row ds_collapse_flag" data-ds-appid="12345"
+# Fake html scraping for testing
+FAKE_SEARCH_HTML = """<a class="search_result_row ds_collapse_flag" data-ds-appid="12345"
                 data-ds-itemkey="App_2501550" data-ds-steam-deck-compat-handled="true" 
                 data-ds-tagids="[4255,4885,4637,19,12057,4026,1774]" data-gpnav="item"
                 data-search-page="1" href="https://store.steampowered.com/app/2501550/Bullet_Hell_Monday_Finale/?snr=1_7_7_230_150_1"
@@ -32,11 +30,8 @@ def fake_html() -> str:
                 <div style="clear: left;"></div>
                 </a>"""
 
-
-@pytest.fixture
-def fake_html_soup() -> str:
-    """Fake html after it has been passed through soup"""
-    return """<html>
+# Fake html after it has been passed through soup
+FAKE_STORE_PAGE_HTML = """<html>
         <body>
         <div class="glance_ctn_responsive_right" data-panel='{"flow-children":"column"}' id="glanceCtnResponsiveRight">
         <!-- when the javascript runs, it will set these visible or not depending on what fits in the area -->
@@ -66,11 +61,8 @@ def fake_html_soup() -> str:
         </body>
         </html>"""
 
-
-@pytest.fixture
-def html_no_tags() -> str:
-    """Fake html containing tag and price data"""
-    return """<html>
+# Fake html containing tag and price data
+FAKE_DISCOUNTED_STORE_PAGE_HTML = """<html>
         <body>
         <div class="glance_ctn_responsive_right" data-panel='{"flow-children":"column"}' id="glanceCtnResponsiveRight">
         <!-- when the javascript runs, it will set these visible or not depending on what fits in the area -->
@@ -98,6 +90,24 @@ def html_no_tags() -> str:
         </html>"""
 
 
+@pytest.fixture
+def fake_html() -> str:
+    """Fake html scraping for testing"""
+    return FAKE_SEARCH_HTML
+
+
+@pytest.fixture
+def fake_html_soup() -> str:
+    """Fake html after it has been passed through soup"""
+    return FAKE_STORE_PAGE_HTML
+
+
+@pytest.fixture
+def html_no_tags() -> str:
+    """Fake html containing tag and price data"""
+    return FAKE_DISCOUNTED_STORE_PAGE_HTML
+
+
 @pytest.fixture
 def fake_response() -> dict:
     """Fake API response"""
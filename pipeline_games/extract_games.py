@@ -1,22 +1,83 @@
 """Script to get information from Steam website and API"""
+from codecs import getincrementaldecoder
 import csv
-from urllib.request import urlopen
-from bs4 import BeautifulSoup
-import requests
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from itertools import chain
+import json
+from os import environ
+import re
+from typing import Iterable, Iterator, NotRequired, TypedDict
+from bs4 import BeautifulSoup, SoupStrainer
+from lxml import etree
+
+from http_client import SteamRequestError, get_response, raise_for_status
+from json_decoder import make_json_decoder
+from response_cache import get_response_cache
+
+ENRICHMENT_WORKERS = int(environ.get("ENRICHMENT_WORKERS", 8))
+# Steam's public appdetails endpoint rejects more than one app ID per request,
+# so batching is off unless APPDETAILS_BATCH_SIZE is raised
+APPDETAILS_BATCH_SIZE = int(environ.get("APPDETAILS_BATCH_SIZE", 1))
+MAX_SEARCH_PAGES = int(environ.get("MAX_SEARCH_PAGES", 20))
+SEARCH_PAGES_AT_ONCE = int(environ.get("SEARCH_PAGES_AT_ONCE", 4))
+SEARCH_CUTOFF_DAYS = int(environ.get("SEARCH_CUTOFF_DAYS", 14))
+
+HTML_PARSER = environ.get("HTML_PARSER", "lxml")
+
+# Only the nodes the parse functions read are built into the tree
+SEARCH_RESULTS_ONLY = SoupStrainer(
+    "a", attrs={"class": re.compile(r"(^|\s)search_result_row(\s|$)")})
+TAGS_AND_PRICES_ONLY = SoupStrainer(attrs={"class": re.compile(
+    r"(^|\s)(app_tag|game_purchase_price|discount_original_price|discount_final_price)(\s|$)")})
+
+
+class Platforms(TypedDict):
+    """Operating systems in an appdetails response"""
+    windows: bool
+    mac: bool
+    linux: bool
+
+
+class Genre(TypedDict):
+    """Genre in an appdetails response"""
+    description: str
+
+
+class AppData(TypedDict, total=False):
+    """The fields of an appdetails response the pipeline uses"""
+    platforms: Platforms
+    genres: list[Genre]
+    developers: list[str]
+    publishers: list[str]
+
+
+class AppDetails(TypedDict):
+    """Result for one app ID in an appdetails response"""
+    success: bool
+    data: NotRequired[AppData]
+
+
+decode_appdetails = make_json_decoder(dict[str, AppDetails | None])
 
 
 def get_html(url: str) -> str:
     """Open the url and get the information."""
-    page = urlopen(url)
-    html_bytes = page.read()
+    html_bytes = get_response_cache().get(url)
     html = html_bytes.decode("utf_8")
 
     return html
 
 
-def parse_app_id_bs(html: str) -> list[dict]:
+def make_soup(html: str, parse_only: SoupStrainer | None = None,
+              parser: str | None = None) -> BeautifulSoup:
+    """Parse html with the configured parser, keeping only what parse_only matches"""
+    return BeautifulSoup(html, parser or HTML_PARSER, parse_only=parse_only)
+
+
+def parse_app_id_bs(html: str, parser: str | None = None) -> list[dict]:
     """Find the app id, title and release date from the url."""
-    soup = BeautifulSoup(html, "html.parser")
+    soup = make_soup(html, SEARCH_RESULTS_ONLY, parser)
     tags = soup.find_all(
         "a", class_="search_result_row ds_collapse_flag")
     games = []
@@ -31,6 +92,108 @@ def parse_app_id_bs(html: str) -> list[dict]:
     return games
 
 
+def is_released_before(game: dict, cutoff: date) -> bool:
+    """Check whether a search result was released before the cutoff,
+    games without a full release date are treated as new"""
+    try:
+        return datetime.strptime(game["release_date"].strip(), "%d %b, %Y").date() < cutoff
+    except ValueError:
+        return False
+
+
+class SearchResultsParser:
+    """Incremental parser for search result pages, built on lxml's pull parser.
+    Fed the page a chunk at a time, it collects each game's app id, title and
+    release date as soon as the game's search_result_row link closes,
+    matching parse_app_id_bs"""
+
+    def __init__(self):
+        self._parser = etree.HTMLPullParser(events=("end",), tag="a")
+        self.games = []
+
+    def feed(self, data: str) -> None:
+        """Parses the next chunk of the page"""
+        self._parser.feed(data)
+        self._read_games()
+
+    def close(self) -> None:
+        """Parses whatever is left once the page has all been fed"""
+        self._parser.close()
+        self._read_games()
+
+    def _read_games(self) -> None:
+        for _, link in self._parser.read_events():
+            if link.get("class") != "search_result_row ds_collapse_flag":
+                continue
+            title = next((span for span in link.iter("span")
+                          if "title" in (span.get("class") or "").split()), None)
+            release_date = next((div for div in link.iter("div") if div.get("class")
+                                 == "col search_released responsive_secondrow"), None)
+            self.games.append({
+                "app_id": link.get("data-ds-appid"),
+                "title": "".join(title.itertext()) if title is not None else None,
+                "release_date": ("".join(release_date.itertext())
+                                 if release_date is not None else None)})
+            link.clear(keep_tail=True)
+
+    def collect_games(self) -> list[dict]:
+        """Returns the games completed since the last call"""
+        games, self.games = self.games, []
+        return games
+
+
+def iter_html_chunks(url: str, chunk_size: int = 16384) -> Iterator[str]:
+    """Yield the page at url as decoded text, a chunk at a time as it downloads"""
+    with get_response(url, stream=True) as response:
+        raise_for_status(response)
+        decoder = getincrementaldecoder("utf_8")()
+        for chunk in response.iter_content(chunk_size):
+            yield decoder.decode(chunk)
+        yield decoder.decode(b"", final=True)
+
+
+def stream_search_results(url: str) -> Iterator[dict]:
+    """Yield each game on a search results page as soon as it has downloaded"""
+    parser = SearchResultsParser()
+    for chunk in iter_html_chunks(url):
+        parser.feed(chunk)
+        yield from parser.collect_games()
+    parser.close()
+    yield from parser.collect_games()
+
+
+def crawl_search_results(search_url: str, cutoff: date, known_app_ids: set[str],
+                         max_pages: int = MAX_SEARCH_PAGES,
+                         pages_at_once: int = SEARCH_PAGES_AT_ONCE) -> Iterator[dict]:
+    """Find new games across as many pages of search results as needed, fetching
+    several pages at once. Games on the first page of each batch are yielded
+    as they download. Stops after the first page that is empty, reaches a
+    game released before the cutoff or holds only known games.
+    Known games and repeats of the same app id are left out"""
+    seen_app_ids = set(known_app_ids)
+    with ThreadPoolExecutor(max_workers=pages_at_once) as executor:
+        for first_page in range(1, max_pages + 1, pages_at_once):
+            later_pages = [executor.submit(list, stream_search_results(f"{search_url}&page={page}"))
+                           for page in range(first_page + 1,
+                                             min(first_page + pages_at_once, max_pages + 1))]
+            pages = chain([stream_search_results(f"{search_url}&page={first_page}")],
+                          (later_page.result() for later_page in later_pages))
+            for page_games in pages:
+                page_is_empty, reached_cutoff = True, False
+                only_known_games = True
+                for game in page_games:
+                    page_is_empty = False
+                    if is_released_before(game, cutoff):
+                        reached_cutoff = True
+                        continue
+                    only_known_games = only_known_games and game["app_id"] in known_app_ids
+                    if game["app_id"] not in seen_app_ids:
+                        seen_app_ids.add(game["app_id"])
+                        yield game
+                if page_is_empty or reached_cutoff or only_known_games:
+                    return
+
+
 def parse_game_bs(soup) -> list[str]:
     """Find the user tags for each game."""
     tags = soup.find_all("a", class_="app_tag")
@@ -97,31 +260,121 @@ def get_publisher_name(data: dict) -> list:
     return publishers[:-1]
 
 
-def update_game_information(all_recent_games: list):
-    """Update game dictionary with information from the API"""
+def get_appdetails_url(app_ids: list[str]) -> str:
+    """Returns the appdetails API url for one or more app IDs"""
+    return f"""https://store.steampowered.com/api/appdetails?appids={",".join(app_ids)}"""
+
+
+def get_appdetails_batch(app_ids: list[str]) -> dict | None:
+    """Requests appdetails for several app IDs in one call, caching each game's
+    details on its own. Returns None if Steam rejects the batch"""
+    cache = get_response_cache()
+    try:
+        request = cache.fetch(get_appdetails_url(app_ids))
+        raise_for_status(request)
+        response = decode_appdetails(request.content)
+    except (SteamRequestError, ValueError):
+        return None
+    if not isinstance(response, dict):
+        return None
+    details = {}
+    for app_id in app_ids:
+        if (response.get(app_id) or {}).get("success"):
+            details[app_id] = response[app_id]
+            cache.store(get_appdetails_url([app_id]),
+                        json.dumps({app_id: response[app_id]}).encode())
+    return details
+
+
+def get_single_appdetails(app_id: str) -> dict:
+    """Returns the appdetails response for one app ID, from the cache while it is fresh"""
+    return decode_appdetails(get_response_cache().get(get_appdetails_url([app_id])))[app_id]
+
+
+def get_appdetails(app_ids: list[str], batch_size: int = APPDETAILS_BATCH_SIZE,
+                   executor: ThreadPoolExecutor | None = None) -> dict:
+    """Returns the appdetails response for each app ID, requesting up to batch_size
+    uncached IDs per call, or each on its own by default. IDs missing from a batch
+    are requested on their own, and once Steam rejects a batch the rest are
+    requested on their own too, on the executor if given"""
+    cache = get_response_cache()
+    details = {}
+    uncached_ids = []
+    for app_id in app_ids:
+        cached = cache.get_fresh(get_appdetails_url([app_id]))
+        if cached is not None:
+            details[app_id] = decode_appdetails(cached)[app_id]
+        else:
+            uncached_ids.append(app_id)
+
+    single_ids = []
+    while uncached_ids:
+        batch, uncached_ids = uncached_ids[:batch_size], uncached_ids[batch_size:]
+        batch_details = get_appdetails_batch(batch) if len(batch) > 1 else {}
+        if batch_details is None:
+            batch_size = 1
+            batch_details = {}
+        details.update(batch_details)
+        single_ids.extend(app_id for app_id in batch if app_id not in batch_details)
+    details.update(zip(single_ids, (executor.map if executor else map)(
+        get_single_appdetails, single_ids)))
+    return details
+
+
+def add_store_page_information(game: dict) -> dict:
+    """Update a game dictionary with the user tags and prices from its store page"""
+    game_webpage = get_html(
+        f"""https://store.steampowered.com/app/{game["app_id"]}""")
+    soup = make_soup(game_webpage, TAGS_AND_PRICES_ONLY)
+    tags_for_game = parse_game_bs(soup)
+    game["user_tags"] = tags_for_game
+    price_of_game = parse_price_bs(soup)
+    game.update(price_of_game)
+
+    return game
+
+
+def add_appdetails_information(game: dict, response: dict) -> dict:
+    """Update a game dictionary with its platforms, genres, developers
+    and publishers from the appdetails API"""
+    compatible_systems = system_requirements(response)
+
+    game.update(compatible_systems)
+    steam_genres = get_genre_from_steam(response)
+    game['genres'] = steam_genres
+    developer = get_developer_name(response)
+    game['developers'] = developer
+    publisher = get_publisher_name(response)
+    game['publishers'] = publisher
+
+    return game
+
+
+def update_game_information(all_recent_games: Iterable[dict],
+                            max_workers: int = ENRICHMENT_WORKERS,
+                            batch_size: int = APPDETAILS_BATCH_SIZE) -> list[dict]:
+    """Update game dictionaries with information from the API, enriching
+    several games at once, starting on each game as soon as it arrives,
+    while keeping their order. Unless appdetails batching is turned on,
+    each game's appdetails are fetched alongside its store page"""
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        batched_app_ids = []
+        store_pages = []
+        single_details = {}
+        for game in all_recent_games:
+            store_pages.append(executor.submit(add_store_page_information, game))
+            if batch_size > 1:
+                batched_app_ids.append(game["app_id"])
+            else:
+                single_details[game["app_id"]] = executor.submit(
+                    get_single_appdetails, game["app_id"])
+        all_details = get_appdetails(batched_app_ids, batch_size, executor)
+        all_details.update({app_id: details.result()
+                            for app_id, details in single_details.items()})
+        all_recent_games = [store_page.result() for store_page in store_pages]
+
     for game in all_recent_games:
-        game_webpage = get_html(
-            f"""https://store.steampowered.com/app/{game["app_id"]}""")
-        soup = BeautifulSoup(game_webpage, "html.parser")
-        tags_for_game = parse_game_bs(soup)
-        game["user_tags"] = tags_for_game
-        price_of_game = parse_price_bs(soup)
-        game.update(price_of_game)
-
-        request = requests.get(
-            f"""https://store.steampowered.com/api/appdetails?appids={game["app_id"]}""",
-            timeout=10)
-
-        response = request.json()[game["app_id"]]['data']
-        compatible_systems = system_requirements(response)
-
-        game.update(compatible_systems)
-        steam_genres = get_genre_from_steam(response)
-        game['genres'] = steam_genres
-        developer = get_developer_name(response)
-        game['developers'] = developer
-        publisher = get_publisher_name(response)
-        game['publishers'] = publisher
+        add_appdetails_information(game, all_details[game["app_id"]]['data'])
 
     return all_recent_games
 
@@ -139,8 +392,8 @@ if __name__ == "__main__":
 
     RELEASE_WEBSITE = "https://store.steampowered.com/search/?sort_by=Released_DESC&category1=998&supportedlang=english&ndl=1"
 
-    website = get_html(RELEASE_WEBSITE)
-    all_games = parse_app_id_bs(website)
+    search_cutoff = date.today() - timedelta(days=SEARCH_CUTOFF_DAYS)
+    all_games = crawl_search_results(RELEASE_WEBSITE, search_cutoff, set())
 
     updated_games = update_game_information(all_games)
     convert_to_csv(updated_games, 'games.csv')
@@ -0,0 +1,69 @@
+"""Pooled HTTP client shared by the games pipeline, so connections (and their
+TLS handshakes) to Steam are made once per run and reused for every request"""
+from os import environ
+from threading import Lock
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+
+from rate_limiter import wait_for_token
+
+
+CONNECT_TIMEOUT = float(environ.get("HTTP_CONNECT_TIMEOUT", 5))
+READ_TIMEOUT = float(environ.get("HTTP_READ_TIMEOUT", 10))
+# Enough connections for every enrichment worker and search page fetched at once
+POOL_SIZE = int(environ.get("HTTP_POOL_SIZE", 16))
+
+
+class SteamRequestError(requests.RequestException):
+    """Exception class for a request that failed, recording the url
+    and the HTTP status (None if no response was received)"""
+
+    def __init__(self, url: str, status_code: int | None = None, reason: str = ""):
+        self.url = url
+        self.status_code = status_code
+        self.reason = reason
+        status = f"HTTP {status_code}" if status_code else "no response"
+        super().__init__(f"Request to {url} failed ({status}): {reason}")
+
+
+def create_session(pool_size: int = POOL_SIZE) -> requests.Session:
+    """Returns a session keeping up to pool_size connections alive per host,
+    asking for compressed responses in every encoding that can be decoded
+    (brotli too when the brotli package is installed)"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+    return session
+
+
+_session = None
+_session_lock = Lock()
+
+
+def get_session() -> requests.Session:
+    """Returns the session shared by the whole run, creating it on first use"""
+    global _session  # pylint: disable=global-statement
+    with _session_lock:
+        if _session is None:
+            _session = create_session()
+    return _session
+
+
+def get_response(url: str, headers: dict | None = None, stream: bool = False) -> requests.Response:
+    """Requests url on the shared session once the rate limit allows"""
+    wait_for_token(url)
+    try:
+        return get_session().get(url, headers=headers or {}, stream=stream,
+                                 timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+    except requests.RequestException as error:
+        raise SteamRequestError(url, reason=str(error)) from error
+
+
+def raise_for_status(response: requests.Response) -> None:
+    """Raises SteamRequestError if the response is an HTTP error"""
+    if response.status_code >= 400:
+        raise SteamRequestError(response.url, response.status_code, response.reason)
@@ -21,6 +21,13 @@ def get_db_connection(config) -> connection:
         return f"Error connecting to database. {err}"
 
 
+def get_known_app_ids(conn: connection, released_since) -> set[str]:
+    """Returns the app ids of games already loaded that were released since a date"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT app_id FROM game WHERE release_date >= %s;", [released_since])
+        return {str(row['app_id']) for row in cur.fetchall()}
+
+
 def execute_batch_columns(conn: connection, data: pd.DataFrame, table: str, column: str, page_size=100) -> None:
     """batch execution of adding specified data to the database"""
     tuples = list(zip(data.unique()))
@@ -1,20 +1,30 @@
 """Script combining extract, transform and load"""
+from datetime import date, timedelta
 from os import environ
 from dotenv import load_dotenv
 import pandas as pd
 
-from extract_games import get_html, parse_app_id_bs, update_game_information
+from extract_games import crawl_search_results, update_game_information, SEARCH_CUTOFF_DAYS
 from transform_games import identify_unique_genre, create_user_generated_column, drop_unnecessary_columns, convert_date_to_datetime, convert_price_to_float, check_data_is_not_null, explode_column_to_individual_rows
-from load_games import get_db_connection, upload_publishers, upload_developers, upload_genres, upload_games, upload_game_genre_link, upload_game_publisher_link, upload_game_developer_link
+from load_games import get_db_connection, get_known_app_ids, upload_publishers, upload_developers, upload_genres, upload_games, upload_game_genre_link, upload_game_publisher_link, upload_game_developer_link
 
 if __name__ == "__main__":
 
     RELEASE_WEBSITE = "https://store.steampowered.com/search/?sort_by=Released_DESC&category1=998&supportedlang=english&ndl=1"
 
-    website = get_html(RELEASE_WEBSITE)
-    all_games = parse_app_id_bs(website)
+    load_dotenv()
+    configuration = environ
+    connect_d = get_db_connection(configuration)
+
+    search_cutoff = date.today() - timedelta(days=SEARCH_CUTOFF_DAYS)
+    known_app_ids = get_known_app_ids(connect_d, search_cutoff)
+    all_games = update_game_information(
+        crawl_search_results(RELEASE_WEBSITE, search_cutoff, known_app_ids))
+    if not all_games:
+        print("No new games found.")
+        connect_d.close()
+        raise SystemExit
 
-    all_games = update_game_information(all_games)
     data_frame = pd.DataFrame(all_games)
 
     unique_genre_df = identify_unique_genre(data_frame)
@@ -52,10 +62,6 @@ if __name__ == "__main__":
     games_df = game_df.drop_duplicates()
     games_only = games_df.copy()
 
-    load_dotenv()
-    configuration = environ
-    connect_d = get_db_connection(configuration)
-
     try:
         upload_publishers(final_df, connect_d)
         upload_developers(final_df, connect_d)
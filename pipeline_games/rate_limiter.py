@@ -0,0 +1,89 @@
+"""Token bucket rate limiting for requests to Steam, shared by threads,
+processes and coroutines so parallel extraction stays under Steam's limits"""
+
+from asyncio import sleep as async_sleep
+from multiprocessing import Lock, Value
+from os import environ
+from time import monotonic, sleep
+from urllib.parse import urlparse
+
+
+STEAM_HOSTS = ("store.steampowered.com",)
+
+# Requests per second and burst size for each family of Steam endpoints,
+# each can be overridden with STEAM_<FAMILY>_RATE and STEAM_<FAMILY>_BURST
+ENDPOINT_LIMITS = {"store_page": (10, 10),
+                   "appdetails": (200 / 300, 20),
+                   "appreviews": (20, 20)}
+
+
+class TokenBucket:
+    """Hands out tokens at a steady rate, allowing bursts up to capacity.
+    The bucket's state lives in shared memory, so it limits every thread
+    and every forked process (or pool worker given it through an
+    initializer) that uses it, not just the one that created it"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._lock = Lock()
+        self._tokens = Value("d", capacity, lock=False)
+        self._updated_at = Value("d", monotonic(), lock=False)
+
+    def reserve(self, tokens: float = 1) -> float:
+        """Takes tokens from the bucket, going into debt if there are too few,
+        and returns the seconds to wait before the tokens are really available"""
+        with self._lock:
+            now = monotonic()
+            refilled = self._tokens.value + (now - self._updated_at.value) * self.rate
+            self._tokens.value = min(self.capacity, refilled) - tokens
+            self._updated_at.value = now
+            return max(0.0, -self._tokens.value / self.rate)
+
+    def acquire(self, tokens: float = 1) -> None:
+        """Blocks the calling thread until tokens are available"""
+        sleep(self.reserve(tokens))
+
+    async def acquire_async(self, tokens: float = 1) -> None:
+        """Waits without blocking the event loop until tokens are available"""
+        await async_sleep(self.reserve(tokens))
+
+
+def create_rate_limiters() -> dict[str, TokenBucket]:
+    """Returns a token bucket for each family of Steam endpoints"""
+    limiters = {}
+    for family, (rate, burst) in ENDPOINT_LIMITS.items():
+        rate = float(environ.get(f"STEAM_{family.upper()}_RATE", rate))
+        burst = float(environ.get(f"STEAM_{family.upper()}_BURST", burst))
+        limiters[family] = TokenBucket(rate, burst)
+    return limiters
+
+
+RATE_LIMITERS = create_rate_limiters()
+
+
+def get_endpoint_family(url: str) -> str | None:
+    """Returns which family of Steam endpoints a url belongs to,
+    or None if the url is not for Steam"""
+    parsed_url = urlparse(url)
+    if parsed_url.hostname not in STEAM_HOSTS:
+        return None
+    if parsed_url.path.startswith("/appreviews/"):
+        return "appreviews"
+    if parsed_url.path.startswith("/api/appdetails"):
+        return "appdetails"
+    return "store_page"
+
+
+def wait_for_token(url: str) -> None:
+    """Blocks until a request to url is allowed"""
+    family = get_endpoint_family(url)
+    if family:
+        RATE_LIMITERS[family].acquire()
+
+
+async def wait_for_token_async(url: str) -> None:
+    """Waits until a request to url is allowed"""
+    family = get_endpoint_family(url)
+    if family:
+        await RATE_LIMITERS[family].acquire_async()
@@ -0,0 +1,168 @@
+"""On-disk cache of Steam responses so repeat runs skip pages fetched recently"""
+from hashlib import sha256
+from os import environ
+from pathlib import Path
+import sqlite3
+from threading import Lock
+from time import time
+from urllib.parse import urlparse
+
+import requests
+
+from http_client import get_response, raise_for_status
+from rate_limiter import get_endpoint_family
+
+
+CACHE_DIRECTORY = environ.get("STEAM_CACHE_DIR", ".steam_cache")
+CACHE_MAX_BYTES = int(environ.get("STEAM_CACHE_MAX_BYTES", 500_000_000))
+CACHE_REPLAY = environ.get("STEAM_CACHE_REPLAY", "") == "1"
+
+# Seconds a response stays fresh for each family of Steam endpoints,
+# each can be overridden with STEAM_<FAMILY>_TTL. Families not listed are never cached
+ENDPOINT_TTLS = {"store_page": 12 * 60 * 60,
+                 "appdetails": 24 * 60 * 60}
+
+# Store pages listing new releases change by the minute so are never cached
+UNCACHED_PATHS = ("/search/",)
+
+
+class CacheMiss(Exception):
+    """Exception class for a response missing from the cache in replay mode"""
+
+    def __init__(self, url: str):
+        super().__init__(f"No recorded response for {url}")
+
+
+class ResponseCache:
+    """SQLite store of response bodies, addressed by the SHA-256 of their content
+    so identical bodies are stored once, and indexed by url. Stale responses are
+    revalidated with their ETag or Last-Modified date, and the least recently used
+    responses are evicted once the bodies grow past max_bytes.
+    In replay mode the network is never used, recorded responses are served
+    whatever their age"""
+
+    def __init__(self, directory: str = CACHE_DIRECTORY, max_bytes: int = CACHE_MAX_BYTES,
+                 ttls: dict[str, float] | None = None, replay: bool = CACHE_REPLAY):
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttls = ttls if ttls is not None else {
+            family: float(environ.get(f"STEAM_{family.upper()}_TTL", ttl))
+            for family, ttl in ENDPOINT_TTLS.items()}
+        self.replay = replay
+        self._lock = Lock()
+        self._conn = sqlite3.connect(Path(directory) / "responses.sqlite3",
+                                     check_same_thread=False, isolation_level=None)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS body (
+                digest TEXT PRIMARY KEY, content BLOB NOT NULL, size INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS response (
+                url TEXT PRIMARY KEY, digest TEXT NOT NULL, etag TEXT, last_modified TEXT,
+                fetched_at REAL NOT NULL, used_at REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS response_used_at ON response (used_at);""")
+
+    def lookup(self, url: str) -> dict | None:
+        """Returns the recorded response for a url, if there is one"""
+        with self._lock:
+            row = self._conn.execute("""SELECT content, etag, last_modified, fetched_at
+                FROM response JOIN body USING (digest) WHERE url = ?""", (url,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE response SET used_at = ? WHERE url = ?", (time(), url))
+        return dict(zip(["content", "etag", "last_modified", "fetched_at"], row))
+
+    def store(self, url: str, content: bytes, etag: str | None = None,
+              last_modified: str | None = None) -> None:
+        """Records a response then evicts old responses if over the size limit"""
+        digest = sha256(content).hexdigest()
+        now = time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute("INSERT OR IGNORE INTO body VALUES (?, ?, ?)",
+                               (digest, content, len(content)))
+            self._conn.execute("INSERT OR REPLACE INTO response VALUES (?, ?, ?, ?, ?, ?)",
+                               (url, digest, etag, last_modified, now, now))
+            self._conn.execute("COMMIT")
+        self.evict()
+
+    def mark_fresh(self, url: str) -> None:
+        """Restarts the time to live of a response Steam says is unchanged"""
+        with self._lock:
+            self._conn.execute("UPDATE response SET fetched_at = ? WHERE url = ?", (time(), url))
+
+    def evict(self) -> None:
+        """Removes the least recently used responses, and bodies no
+        longer used by any response, until under the size limit"""
+        with self._lock:
+            total_size = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM body").fetchone()[0]
+            if total_size <= self.max_bytes:
+                return
+            self._conn.execute("BEGIN")
+            for url, digest in self._conn.execute(
+                    "SELECT url, digest FROM response ORDER BY used_at").fetchall():
+                if total_size <= self.max_bytes:
+                    break
+                self._conn.execute("DELETE FROM response WHERE url = ?", (url,))
+                if not self._conn.execute("SELECT 1 FROM response WHERE digest = ?",
+                                          (digest,)).fetchone():
+                    total_size -= self._conn.execute(
+                        "DELETE FROM body WHERE digest = ? RETURNING size", (digest,)).fetchone()[0]
+            self._conn.execute("COMMIT")
+
+    def get_ttl(self, url: str) -> float | None:
+        """Returns how long a response from url stays fresh, None if it is not cached"""
+        if urlparse(url).path.startswith(UNCACHED_PATHS):
+            return None
+        return self.ttls.get(get_endpoint_family(url))
+
+    def get_fresh(self, url: str) -> bytes | None:
+        """Returns the recorded body for url if it is still fresh
+        (or in replay mode, if there is one at all)"""
+        ttl = self.get_ttl(url)
+        cached = self.lookup(url) if ttl is not None else None
+        if cached and (self.replay or time() - cached["fetched_at"] < ttl):
+            return cached["content"]
+        return None
+
+    def fetch(self, url: str, headers: dict | None = None) -> requests.Response:
+        """Requests url from Steam without consulting the cache"""
+        if self.replay:
+            raise CacheMiss(url)
+        return get_response(url, headers=headers)
+
+    def get(self, url: str) -> bytes:
+        """Returns the body at url, from the cache while it is fresh,
+        otherwise from Steam, revalidating the recorded copy if there is one"""
+        fresh = self.get_fresh(url)
+        if fresh is not None:
+            return fresh
+
+        ttl = self.get_ttl(url)
+        cached = self.lookup(url) if ttl is not None else None
+        headers = {}
+        if cached and cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        if cached and cached["last_modified"]:
+            headers["If-Modified-Since"] = cached["last_modified"]
+        response = self.fetch(url, headers)
+        if cached and response.status_code == 304:
+            self.mark_fresh(url)
+            return cached["content"]
+        raise_for_status(response)
+        if ttl is not None:
+            self.store(url, response.content, response.headers.get("ETag"),
+                       response.headers.get("Last-Modified"))
+        return response.content
+
+
+_response_cache = None
+_response_cache_lock = Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Returns the cache shared by the whole run, opening it on first use"""
+    global _response_cache  # pylint: disable=global-statement
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache()
+    return _response_cache
@@ -1,8 +1,13 @@
 """Script for testing extract_games functions"""
+from datetime import date
+import json
 import os
+from threading import current_thread, main_thread
+from unittest.mock import MagicMock
 from bs4 import BeautifulSoup
+import pytest
 
-from extract_games import get_html, parse_app_id_bs, parse_game_bs, parse_price_bs, system_requirements, get_genre_from_steam, get_developer_name, get_publisher_name, convert_to_csv
+from extract_games import get_html, parse_app_id_bs, parse_game_bs, parse_price_bs, system_requirements, get_genre_from_steam, get_developer_name, get_publisher_name, convert_to_csv, update_game_information, get_appdetails, crawl_search_results, make_soup, SearchResultsParser, TAGS_AND_PRICES_ONLY
 
 
 def test_html_returns_a_string():
@@ -88,3 +93,182 @@ def test_csv_created():
     convert_to_csv([{'fake_data': 3}, {'fake_data': 2}], 'test.csv')
     assert os.path.exists('test.csv')
     os.remove('test.csv')
+
+
+def test_update_game_information_keeps_order(monkeypatch, fake_html_soup, fake_response):
+    """Check games are enriched concurrently but returned in their original order"""
+    monkeypatch.setattr("extract_games.get_html", lambda url: fake_html_soup)
+    fetching_threads = set()
+
+    def fake_get_single_appdetails(app_id: str) -> dict:
+        fetching_threads.add(current_thread())
+        return {"success": True, "data": fake_response}
+    monkeypatch.setattr("extract_games.get_single_appdetails", fake_get_single_appdetails)
+    games = [{"app_id": str(app_id)} for app_id in range(20)]
+
+    result = update_game_information(games, max_workers=4)
+
+    assert [game["app_id"] for game in result] == [str(app_id) for app_id in range(20)]
+    assert result[0] == {'app_id': '0', 'user_tags': 'Fake_Tag 1,Fake_Tag 2,Fake_Tag 3',
+                         'full_price': '£1.69', 'sale_price': '£1.69',
+                         'windows': True, 'mac': False, 'linux': False,
+                         'genres': 'Action,Adventure,Simulation,Strategy',
+                         'developers': 'Fake Developer 1,Fake Developer 2',
+                         'publishers': 'Fake Publisher'}
+    assert fetching_threads and main_thread() not in fetching_threads
+
+
+def test_update_game_information_batches_when_turned_on(monkeypatch, fake_html_soup,
+                                                        fake_response):
+    """Check appdetails are requested together only when batching is turned on"""
+    monkeypatch.setattr("extract_games.get_html", lambda url: fake_html_soup)
+    fake_get_appdetails = MagicMock(side_effect=lambda app_ids, batch_size, executor: {
+        app_id: {"success": True, "data": fake_response} for app_id in app_ids})
+    monkeypatch.setattr("extract_games.get_appdetails", fake_get_appdetails)
+    fake_get_single_appdetails = MagicMock()
+    monkeypatch.setattr("extract_games.get_single_appdetails", fake_get_single_appdetails)
+    games = [{"app_id": str(app_id)} for app_id in range(5)]
+
+    result = update_game_information(games, max_workers=2, batch_size=50)
+
+    assert [game["app_id"] for game in result] == [str(app_id) for app_id in range(5)]
+    assert fake_get_appdetails.call_args[0][:2] == (["0", "1", "2", "3", "4"], 50)
+    assert not fake_get_single_appdetails.called
+
+
+def fake_appdetails_cache(batch_content: bytes) -> MagicMock:
+    """Fake response cache answering batched appdetails calls with batch_content"""
+    fake_cache = MagicMock()
+    fake_cache.get_fresh.side_effect = lambda url: (
+        b'{"1": {"success": true, "data": {}}}' if url.endswith("=1") else None)
+    fake_cache.fetch.return_value.status_code = 200
+    fake_cache.fetch.return_value.content = batch_content
+    fake_cache.get.side_effect = lambda url: json.dumps(
+        {url.split("=")[-1]: {"success": True, "data": {"developers": ["Single"]}}}).encode()
+    return fake_cache
+
+
+def test_get_appdetails_batches_uncached(monkeypatch):
+    """Check uncached app IDs are requested together and cached IDs not at all"""
+    fake_cache = fake_appdetails_cache(
+        b'{"2": {"success": true, "data": {}}, "3": {"success": true, "data": {}}}')
+    monkeypatch.setattr("extract_games.get_response_cache", lambda: fake_cache)
+
+    result = get_appdetails(["1", "2", "3"], batch_size=50)
+
+    assert set(result) == {"1", "2", "3"}
+    assert fake_cache.fetch.call_args[0][0].endswith("appids=2,3")
+    assert fake_cache.store.call_count == 2
+    assert not fake_cache.get.called
+
+
+def test_get_appdetails_falls_back_to_single_ids(monkeypatch):
+    """Check app IDs Steam leaves out of a batch are requested on their own"""
+    fake_cache = fake_appdetails_cache(b'{"2": {"success": false}, "3": null}')
+    monkeypatch.setattr("extract_games.get_response_cache", lambda: fake_cache)
+
+    result = get_appdetails(["1", "2", "3"], batch_size=50)
+
+    assert result["2"]["data"] == {"developers": ["Single"]}
+    assert result["3"]["data"] == {"developers": ["Single"]}
+    assert fake_cache.get.call_count == 2
+
+
+def test_get_appdetails_does_not_batch_by_default(monkeypatch):
+    """Check app IDs are requested one at a time unless batching is turned on"""
+    fake_cache = fake_appdetails_cache(b"null")
+    monkeypatch.setattr("extract_games.get_response_cache", lambda: fake_cache)
+
+    result = get_appdetails(["2", "3", "4"])
+
+    assert all(details["data"] == {"developers": ["Single"]} for details in result.values())
+    assert not fake_cache.fetch.called
+    assert fake_cache.get.call_count == 3
+
+
+def test_get_appdetails_stops_batching_when_rejected(monkeypatch):
+    """Check one rejected batch switches the rest of the run to single IDs"""
+    fake_cache = fake_appdetails_cache(b"null")
+    monkeypatch.setattr("extract_games.get_response_cache", lambda: fake_cache)
+
+    result = get_appdetails(["2", "3", "4", "5"], batch_size=2)
+
+    assert all(details["data"] == {"developers": ["Single"]} for details in result.values())
+    assert fake_cache.fetch.call_count == 1
+    assert fake_cache.get.call_count == 4
+
+
+def fake_search_pages(fake_html: str, pages: dict[int, list[tuple[str, str]]]):
+    """Returns a fake iter_html_chunks serving search result pages holding
+    the given (app id, release date) pairs in small chunks, and the list of pages requested"""
+    requested = []
+
+    def fake_iter_html_chunks(url: str):
+        page = int(url.split("page=")[-1])
+        requested.append(page)
+        html = "".join(fake_html.replace('data-ds-appid="12345"', f'data-ds-appid="{app_id}"')
+                       .replace("5 Sep, 2023", release_date)
+                       for app_id, release_date in pages.get(page, []))
+        return (html[start:start + 100] for start in range(0, len(html), 100))
+    return fake_iter_html_chunks, requested
+
+
+def test_crawl_search_results_stops_at_cutoff(monkeypatch, fake_html):
+    """Check pages are crawled until a game older than the cutoff is reached"""
+    fake_iter_html_chunks, requested = fake_search_pages(fake_html, {
+        1: [("1", "9 Sep, 2023"), ("2", "9 Sep, 2023")],
+        2: [("3", "8 Sep, 2023"), ("2", "8 Sep, 2023")],
+        3: [("4", "7 Sep, 2023"), ("5", "1 Sep, 2023")],
+        4: [("6", "1 Sep, 2023")]})
+    monkeypatch.setattr("extract_games.iter_html_chunks", fake_iter_html_chunks)
+
+    result = list(crawl_search_results("url?", date(2023, 9, 5), set(), pages_at_once=2))
+
+    assert [game["app_id"] for game in result] == ["1", "2", "3", "4"]
+    assert sorted(requested) == [1, 2, 3, 4]
+
+
+def test_crawl_search_results_stops_at_known_games(monkeypatch, fake_html):
+    """Check known games are left out and a page of only known games ends the crawl"""
+    fake_iter_html_chunks, requested = fake_search_pages(fake_html, {
+        1: [("1", "9 Sep, 2023"), ("2", "9 Sep, 2023")],
+        2: [("2", "9 Sep, 2023"), ("3", "9 Sep, 2023")],
+        3: [("4", "9 Sep, 2023")]})
+    monkeypatch.setattr("extract_games.iter_html_chunks", fake_iter_html_chunks)
+
+    result = list(crawl_search_results("url?", date(2023, 9, 5), {"2", "3"}, pages_at_once=1))
+
+    assert [game["app_id"] for game in result] == ["1"]
+    assert requested == [1, 2]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 4096])
+def test_streamed_search_results_match_parsed_page(fake_html, chunk_size):
+    """Check parsing a page as it arrives finds the same games as parsing it whole"""
+    page = fake_html * 3
+    parser = SearchResultsParser()
+    games = []
+    for start in range(0, len(page), chunk_size):
+        parser.feed(page[start:start + chunk_size])
+        games.extend(parser.collect_games())
+    parser.close()
+
+    assert games + parser.collect_games() == parse_app_id_bs(page)
+
+
+@pytest.mark.parametrize("parser", ["html.parser", "lxml"])
+def test_parsers_give_same_search_results(fake_html, parser):
+    """Check every parser backend finds the same search results"""
+    assert parse_app_id_bs(fake_html * 3, parser) == parse_app_id_bs(fake_html * 3, "html.parser")
+
+
+@pytest.mark.parametrize("parser", ["html.parser", "lxml"])
+@pytest.mark.parametrize("page", ["fake_html_soup", "html_no_tags"])
+def test_strained_store_page_gives_same_tags_and_prices(request, page, parser):
+    """Check tags and prices are unchanged when only their nodes are parsed"""
+    html = request.getfixturevalue(page)
+    full_soup = BeautifulSoup(html, "html.parser")
+    strained_soup = make_soup(html, TAGS_AND_PRICES_ONLY, parser)
+
+    assert parse_game_bs(strained_soup) == parse_game_bs(full_soup)
+    assert parse_price_bs(strained_soup) == parse_price_bs(full_soup)
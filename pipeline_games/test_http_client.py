@@ -0,0 +1,75 @@
+"""Script for testing http_client functions"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from unittest.mock import MagicMock
+
+import pytest
+import requests
+
+from http_client import SteamRequestError, create_session, get_response, raise_for_status
+
+
+class CountingHandler(BaseHTTPRequestHandler):
+    """Answers every GET with a short body, recording which connection it came on"""
+    protocol_version = "HTTP/1.1"
+    connections = set()
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Sends a fixed body with its length so the connection can be kept alive"""
+        CountingHandler.connections.add(self.client_address)
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        """Keeps the test output quiet"""
+
+
+@pytest.fixture
+def local_server_url():
+    """Runs a local HTTP server for the duration of a test"""
+    CountingHandler.connections = set()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), CountingHandler)
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_session_reuses_connection(local_server_url):
+    """Check repeated requests to one host share a single connection"""
+    session = create_session()
+    for page in range(5):
+        assert session.get(f"{local_server_url}/app/{page}").content == b"ok"
+
+    assert len(CountingHandler.connections) == 1
+
+
+def test_session_asks_for_compressed_responses():
+    """Check the session negotiates gzip"""
+    assert "gzip" in create_session().headers["Accept-Encoding"]
+
+
+def test_network_error_raised_with_url(monkeypatch):
+    """Check failures to connect are raised as a SteamRequestError naming the url"""
+    session = MagicMock()
+    session.get.side_effect = requests.ConnectionError("refused")
+    monkeypatch.setattr("http_client.get_session", lambda: session)
+
+    with pytest.raises(SteamRequestError) as error:
+        get_response("http://127.0.0.1/app/10")
+
+    assert error.value.url == "http://127.0.0.1/app/10"
+    assert error.value.status_code is None
+
+
+def test_http_error_raised_with_status():
+    """Check HTTP errors are raised with their status code"""
+    response = MagicMock(status_code=503, url="http://127.0.0.1/app/10", reason="Unavailable")
+
+    with pytest.raises(SteamRequestError) as error:
+        raise_for_status(response)
+
+    assert error.value.status_code == 503
@@ -0,0 +1,42 @@
+"""File with unit tests for json_decoder.py"""
+
+from typing import TypedDict
+
+from pytest import mark, raises
+
+from json_decoder import make_json_decoder
+
+
+class Item(TypedDict):
+    """Schema for testing"""
+    name: str
+    count: int
+
+
+PAYLOAD = b'{"items": [{"name": "a", "count": 1, "unused": [1, 2]}]}'
+
+
+@mark.parametrize("decoder", ["msgspec", "orjson", "json"])
+def test_decoders_agree_on_used_fields(decoder):
+    """Verifies that every decoder gives the same values for the schema's fields"""
+    decoded = make_json_decoder(dict[str, list[Item]], decoder)(PAYLOAD)
+    assert {key: decoded["items"][0][key] for key in Item.__annotations__} == {
+        "name": "a", "count": 1}
+
+
+def test_msgspec_only_builds_schema_fields():
+    """Verifies that fields missing from the schema are skipped"""
+    decoded = make_json_decoder(dict[str, list[Item]], "msgspec")(PAYLOAD)
+    assert decoded == {"items": [{"name": "a", "count": 1}]}
+
+
+def test_msgspec_validates_payload():
+    """Verifies that a payload not matching the schema raises ValueError"""
+    with raises(ValueError):
+        make_json_decoder(Item, "msgspec")(b'{"name": "a", "count": "one"}')
+
+
+def test_unknown_decoder():
+    """Verifies that asking for a decoder that is not available raises ValueError"""
+    with raises(ValueError):
+        make_json_decoder(Item, "simdjson")
@@ -1,6 +1,6 @@
 """Testing script for load_games script"""
 from unittest.mock import MagicMock, patch
-from load_games import execute_batch_columns, execute_batch_columns_for_genres, execute_batch_columns_for_games, get_existing_platform_data, add_to_genre_link_table, add_to_publisher_link_table, add_to_developer_link_table, upload_developers, upload_publishers, upload_genres, upload_games, get_all_game_genre_ids, get_all_developer_game_ids, get_all_publisher_game_ids
+from load_games import get_known_app_ids, execute_batch_columns, execute_batch_columns_for_genres, execute_batch_columns_for_games, get_existing_platform_data, add_to_genre_link_table, add_to_publisher_link_table, add_to_developer_link_table, upload_developers, upload_publishers, upload_genres, upload_games, get_all_game_genre_ids, get_all_developer_game_ids, get_all_publisher_game_ids
 
 
 @patch("load_games.execute_batch")
@@ -149,3 +149,11 @@ def test_games_called(fake_batch, fake_complete_data):
     upload_games(fake_conn, fake_complete_data)
 
     assert fake_batch.call_count == 1
+
+
+def test_known_app_ids_returned_as_strings():
+    """Known app ids match the strings scraped from the search results"""
+    fake_conn = MagicMock()
+    fake_fetch = fake_conn.cursor().__enter__().fetchall
+    fake_fetch.return_value = [{'app_id': 1}, {'app_id': 2}]
+    assert get_known_app_ids(fake_conn, '2023-09-01') == {'1', '2'}
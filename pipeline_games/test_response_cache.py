@@ -0,0 +1,105 @@
+"""Script for testing response_cache functions"""
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep
+from unittest.mock import MagicMock
+
+import pytest
+
+from response_cache import ResponseCache, CacheMiss, get_response_cache
+
+STORE_PAGE = "https://store.steampowered.com/app/10"
+
+
+def fake_response(status_code: int = 200, content: bytes = b"page", headers=None) -> MagicMock:
+    """Fake requests response"""
+    response = MagicMock()
+    response.status_code = status_code
+    response.content = content
+    response.headers = headers or {}
+    return response
+
+
+@pytest.fixture
+def fake_get(monkeypatch) -> MagicMock:
+    """Replaces network requests made by the cache with a mock"""
+    fake = MagicMock(return_value=fake_response(headers={"ETag": '"v1"'}))
+    monkeypatch.setattr("response_cache.get_response", fake)
+    return fake
+
+
+def test_fresh_response_skips_network(tmp_path, fake_get):
+    """Check a second request within the time to live is served from disk"""
+    cache = ResponseCache(str(tmp_path))
+    assert cache.get(STORE_PAGE) == b"page"
+    assert ResponseCache(str(tmp_path)).get(STORE_PAGE) == b"page"
+    assert fake_get.call_count == 1
+
+
+def test_stale_response_revalidated(tmp_path, fake_get):
+    """Check a stale response is revalidated with its ETag and kept on 304"""
+    cache = ResponseCache(str(tmp_path), ttls={"store_page": 0})
+    cache.get(STORE_PAGE)
+    fake_get.return_value = fake_response(304, b"")
+    assert cache.get(STORE_PAGE) == b"page"
+    assert fake_get.call_args.kwargs["headers"] == {"If-None-Match": '"v1"'}
+
+
+def test_other_hosts_not_cached(tmp_path, fake_get):
+    """Check responses from outside Steam are always fetched"""
+    cache = ResponseCache(str(tmp_path))
+    cache.get("https://www.google.co.uk")
+    cache.get("https://www.google.co.uk")
+    assert fake_get.call_count == 2
+
+
+def test_search_results_not_cached(tmp_path, fake_get):
+    """Check the new release listings are always fetched"""
+    cache = ResponseCache(str(tmp_path))
+    cache.get("https://store.steampowered.com/search/?sort_by=Released_DESC")
+    cache.get("https://store.steampowered.com/search/?sort_by=Released_DESC")
+    assert fake_get.call_count == 2
+
+
+def test_least_recently_used_evicted(tmp_path, fake_get):
+    """Check the least recently used responses are evicted when over size"""
+    cache = ResponseCache(str(tmp_path), max_bytes=10)
+    for app_id, content in [(1, b"first"), (2, b"second"), (3, b"third")]:
+        fake_get.return_value = fake_response(content=content)
+        cache.get(f"https://store.steampowered.com/app/{app_id}")
+    assert cache.lookup("https://store.steampowered.com/app/1") is None
+    assert cache.lookup("https://store.steampowered.com/app/2") is None
+    assert cache.lookup("https://store.steampowered.com/app/3")["content"] == b"third"
+
+
+def test_identical_bodies_stored_once(tmp_path, fake_get):
+    """Check bodies are addressed by content so duplicates share storage"""
+    cache = ResponseCache(str(tmp_path), max_bytes=5)
+    cache.get("https://store.steampowered.com/app/1")
+    cache.get("https://store.steampowered.com/app/2")
+    assert cache.lookup("https://store.steampowered.com/app/1")["content"] == b"page"
+
+
+def test_replay_serves_stale_and_raises_on_miss(tmp_path, fake_get):
+    """Check replay mode never uses the network"""
+    ResponseCache(str(tmp_path), ttls={"store_page": 0}).get(STORE_PAGE)
+    replay_cache = ResponseCache(str(tmp_path), ttls={"store_page": 0}, replay=True)
+    assert replay_cache.get(STORE_PAGE) == b"page"
+    with pytest.raises(CacheMiss):
+        replay_cache.get("https://store.steampowered.com/app/11")
+    assert fake_get.call_count == 1
+
+
+def test_shared_cache_opened_once_across_threads(monkeypatch):
+    """Check threads asking for the shared cache at once all get the same one"""
+    def slow_cache():
+        sleep(0.01)
+        return MagicMock()
+    fake_cache_class = MagicMock(side_effect=slow_cache)
+    monkeypatch.setattr("response_cache.ResponseCache", fake_cache_class)
+    monkeypatch.setattr("response_cache._response_cache", None)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        caches = list(executor.map(lambda _: get_response_cache(), range(8)))
+
+    assert fake_cache_class.call_count == 1
+    assert all(cache is caches[0] for cache in caches)
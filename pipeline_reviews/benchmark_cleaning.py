@@ -0,0 +1,65 @@
+"""Benchmarks stripping stop words and punctuation from review text before
+sentiment scoring, comparing the character by character filter against
+str.translate with frozenset stop word lookups, on synthetic reviews with
+mixed case, digits, new lines and runs of spaces. Needs the NLTK stop words"""
+
+from argparse import ArgumentParser
+from random import Random
+from time import perf_counter
+
+from nltk.corpus import stopwords
+from pandas import DataFrame
+
+from sentiment import isolate_non_stop_words, PUNCTUATION_AND_MORE
+
+
+WORDS = ["great", "game", "The", "is", "NOT", "worth", "it", "10/10", "don't",
+         "buy", "fun", "with", "friends", "lag", "after", "patch", "£5", "(sale)",
+         "I", "played", "for", "200h", "and", "it's", "still", "good", "\n", "",
+         "bugs...", "devs", "#1", "a", "masterpiece!", "über", "won't", "refund"]
+
+
+def make_reviews(reviews: int, seed: int = 0) -> list[str]:
+    """Returns reproducible reviews of random words from WORDS"""
+    random = Random(seed)
+    return [" ".join(random.choices(WORDS, k=random.randint(5, 60)))
+            for _ in range(reviews)]
+
+
+def isolate_by_character(reviews_df: DataFrame) -> DataFrame:
+    """Cleans reviews the way sentiment scoring used to, filtering each
+    review a character at a time and searching a list of stop words"""
+    stop_words = stopwords.words("english")
+    punctuation = list(PUNCTUATION_AND_MORE)
+
+    def remove_stopwords(review: str) -> str:
+        review = "".join(letter for letter in review if letter not in punctuation)
+        split_review = review.replace("\n", " ").split(" ")
+        return " ".join(word for word in split_review if word.lower() not in stop_words)
+
+    reviews_df["clean_review"] = reviews_df["review"].apply(remove_stopwords)
+    return reviews_df
+
+
+def time_cleaner(cleaner, reviews: list[str]) -> tuple[float, list[str]]:
+    """Returns how long a cleaner takes over the reviews, and its output"""
+    reviews_df = DataFrame({"review": reviews})
+    time_started = perf_counter()
+    cleaned = cleaner(reviews_df)["clean_review"].tolist()
+    return perf_counter() - time_started, cleaned
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--reviews", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    review_text = make_reviews(args.reviews)
+    character_seconds, by_character = time_cleaner(isolate_by_character, review_text)
+    translate_seconds, by_translate = time_cleaner(isolate_non_stop_words, review_text)
+    assert by_character == by_translate
+
+    print(f"{args.reviews} reviews")
+    print(f"Character filter and list lookups: {character_seconds:.2f} seconds")
+    print(f"str.translate and frozenset lookups: {translate_seconds:.2f} seconds "
+          f"({character_seconds / translate_seconds:.1f}x faster)")
@@ -0,0 +1,78 @@
+"""Benchmarks turning review API responses into the data-frame the transform
+step works on, comparing per-review dicts holding formatted time strings
+(parsed back with strptime) against columnar pages converted once with
+pd.to_datetime, on a synthetic payload of review pages"""
+
+from argparse import ArgumentParser
+from datetime import datetime, timezone
+from time import perf_counter
+
+import pandas as pd
+from pandas import DataFrame
+
+from extract import ReviewBatch, REVIEWS_PER_PAGE
+from fake_steam import FakeSteam
+
+
+def make_payload(reviews: int) -> list[dict]:
+    """Returns the API responses holding the given number of reviews of one game"""
+    fake = FakeSteam(default_reviews=reviews)
+    return [fake.make_page(1, "*" if offset == 0 else f"AoJ/{offset}+=", REVIEWS_PER_PAGE)
+            for offset in range(0, reviews, REVIEWS_PER_PAGE)]
+
+
+def decode_by_row(payload: list[dict]) -> DataFrame:
+    """Decodes the reviews the way extraction used to, a dict per review with
+    its time formatted as a string, then parsed back a row at a time"""
+    reviews = []
+    for response in payload:
+        for review in response["reviews"]:
+            review_dict = {}
+            review_dict["game_id"] = 1
+            review_dict["review"] = review["review"]
+            review_dict["review_score"] = review["votes_up"]
+            review_dict["last_timestamp"] = datetime.fromtimestamp(
+                review["timestamp_created"], timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+            review_dict["playtime_last_2_weeks"] = review["author"]["playtime_forever"]
+            reviews.append(review_dict)
+    reviews_df = DataFrame(reviews)
+    reviews_df["last_timestamp"] = reviews_df["last_timestamp"].apply(
+        lambda row: datetime.strptime(row, "%Y-%m-%d %H:%M:%S").date())
+    return reviews_df
+
+
+def decode_by_column(payload: list[dict]) -> DataFrame:
+    """Decodes the reviews into columnar batches, converting every timestamp at once"""
+    reviews_df = ReviewBatch.concat(ReviewBatch.from_api(response["reviews"], 1)
+                                    for response in payload).to_frame()
+    reviews_df["last_timestamp"] = pd.to_datetime(
+        reviews_df["last_timestamp"], unit="s").dt.date
+    return reviews_df
+
+
+def time_decoder(decoder, payload: list[dict], repeat: int) -> tuple[float, DataFrame]:
+    """Returns the best time over repeat runs of a decoder, and its output"""
+    best = float("inf")
+    for _ in range(repeat):
+        time_started = perf_counter()
+        reviews_df = decoder(payload)
+        best = min(best, perf_counter() - time_started)
+    return best, reviews_df
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--reviews", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    review_payload = make_payload(args.reviews)
+    row_seconds, by_row = time_decoder(decode_by_row, review_payload, args.repeat)
+    column_seconds, by_column = time_decoder(decode_by_column, review_payload, args.repeat)
+    assert by_row["last_timestamp"].tolist() == by_column["last_timestamp"].tolist()
+    assert by_row["review"].tolist() == by_column["review"].tolist()
+
+    print(f"{args.reviews} reviews")
+    print(f"Per-review dicts and strptime: {row_seconds:.3f} seconds")
+    print(f"Columnar pages and to_datetime: {column_seconds:.3f} seconds "
+          f"({row_seconds / column_seconds:.1f}x faster)")
@@ -0,0 +1,71 @@
+"""Benchmarks review extraction against a local fake Steam server,
+reporting pages per second and the number of requests made per game"""
+
+from argparse import ArgumentParser
+from asyncio import run
+from time import perf_counter
+
+from aiohttp import ClientSession
+
+from extract import create_session, get_all_reviews, get_game_reviews
+from fake_steam import FakeSteam, run_fake_steam_server
+
+
+def benchmark_extraction(games: int, reviews_per_game: int, latency: float) -> dict:
+    """Crawls every game from the fake server and returns the timings"""
+    fake = FakeSteam(default_reviews=reviews_per_game, latency=latency)
+    with run_fake_steam_server(fake) as url:
+        time_started = perf_counter()
+        reviews = get_all_reviews(list(range(1, games + 1)), url)
+        time_taken = perf_counter() - time_started
+    pages = sum(fake.requests.values())
+    return {"reviews": len(reviews), "pages": pages, "seconds": time_taken,
+            "pages_per_second": pages / time_taken}
+
+
+async def crawl_with_count_probe(session: ClientSession, game_id: int, base_url: str) -> None:
+    """Requests a game's reviews the way extraction used to: a separate
+    request for the total, then pages until an empty one comes back"""
+    async with session.get(f"{base_url}/appreviews/{game_id}", params={"json": "1"}) as response:
+        total_reviews = (await response.json())["query_summary"]["total_reviews"]
+    cursor = "*"
+    while total_reviews:
+        async with session.get(f"{base_url}/appreviews/{game_id}",
+                               params={"json": "1", "cursor": cursor}) as response:
+            page = await response.json()
+        if not page["reviews"]:
+            return
+        cursor = page["cursor"]
+
+
+def count_requests_per_game(reviews_per_game: int) -> tuple[int, int]:
+    """Returns the requests made for one game with the given number of
+    reviews, before and after the count probe was folded into the first page"""
+    async def crawl(fake: FakeSteam, crawler) -> int:
+        with run_fake_steam_server(fake) as url:
+            async with create_session() as session:
+                await crawler(session, 1, url)
+        return fake.requests[1]
+
+    before = run(crawl(FakeSteam(default_reviews=reviews_per_game), crawl_with_count_probe))
+    after = run(crawl(FakeSteam(default_reviews=reviews_per_game), get_game_reviews))
+    return before, after
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--games", type=int, default=50)
+    parser.add_argument("--reviews-per-game", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="seconds the fake server waits before each response")
+    args = parser.parse_args()
+
+    result = benchmark_extraction(args.games, args.reviews_per_game, args.latency)
+    print(f"{result['reviews']} reviews over {result['pages']} requests "
+          f"in {result['seconds']:.2f} seconds "
+          f"({result['pages_per_second']:.1f} pages per second)")
+
+    print("Requests per game (before -> after):")
+    for number_of_reviews in [0, 5, 50, 150, 1000]:
+        requests_before, requests_after = count_requests_per_game(number_of_reviews)
+        print(f"  {number_of_reviews:>5} reviews: {requests_before} -> {requests_after}")
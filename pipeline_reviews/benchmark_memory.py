@@ -0,0 +1,66 @@
+"""Benchmarks the memory extracted reviews take while held for the transform
+step: a dict per review (with its time formatted as a string) in a list per
+page, compared with a ReviewBatch per page. Pages are decoded from JSON one at
+a time, as the crawl does, so only what each representation keeps is counted"""
+
+from argparse import ArgumentParser
+from datetime import datetime
+from gc import collect
+import json
+from tracemalloc import get_traced_memory, start, stop
+
+from extract import ReviewBatch, REVIEWS_PER_PAGE
+from fake_steam import FakeSteam
+
+
+def make_page_payloads(pages: int) -> list[bytes]:
+    """Returns distinct encoded review pages to decode over and over"""
+    fake = FakeSteam(default_reviews=pages * REVIEWS_PER_PAGE)
+    return [json.dumps(fake.make_page(1, f"AoJ/{page * REVIEWS_PER_PAGE}+=",
+                                      REVIEWS_PER_PAGE)).encode()
+            for page in range(pages)]
+
+
+def keep_as_dicts(raw_reviews: list[dict], game_id: int) -> list[dict]:
+    """Returns a page of reviews the way extraction used to hold them"""
+    page_reviews = []
+    for review in raw_reviews:
+        review_dict = {}
+        review_dict["game_id"] = game_id
+        review_dict["review"] = review["review"]
+        review_dict["review_score"] = review["votes_up"]
+        review_dict["last_timestamp"] = datetime.fromtimestamp(
+            review["timestamp_created"]).strftime("%Y-%m-%d %H:%M:%S")
+        review_dict["playtime_last_2_weeks"] = review["author"]["playtime_forever"]
+        page_reviews.append(review_dict)
+    return page_reviews
+
+
+def measure(keep_page, reviews: int, payloads: list[bytes]) -> int:
+    """Returns the bytes still allocated after keeping every page of reviews"""
+    collect()
+    start()
+    pages = []
+    for page in range(reviews // REVIEWS_PER_PAGE):
+        raw_reviews = json.loads(payloads[page % len(payloads)])["reviews"]
+        pages.append(keep_page(raw_reviews, 2_000_000 + page))
+    del raw_reviews
+    collect()
+    allocated = get_traced_memory()[0]
+    stop()
+    return allocated
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--reviews", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    page_payloads = make_page_payloads(100)
+    text_bytes = sum(len(review["review"]) for payload in page_payloads
+                     for review in json.loads(payload)["reviews"]) / (100 * REVIEWS_PER_PAGE)
+    print(f"{args.reviews} reviews, {text_bytes:.0f} characters of text each")
+    for name, keep in [("dict per review", keep_as_dicts),
+                       ("ReviewBatch per page", ReviewBatch.from_api)]:
+        bytes_per_review = measure(keep, args.reviews, page_payloads) / args.reviews
+        print(f"{name}: {bytes_per_review:.0f} bytes per review")
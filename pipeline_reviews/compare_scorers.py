@@ -0,0 +1,89 @@
+"""Compares the sentiment scorers against NLTK's VADER, the reference, on
+synthetic reviews mixing lexicon, booster and negation words, capitals and
+punctuation, or on real reviews from a file with one review per line.
+Reports each scorer's throughput and how closely its compound scores and
+ratings out of 5 agree with VADER's. Needs the NLTK VADER lexicon"""
+
+from argparse import ArgumentParser
+from random import Random
+from time import perf_counter
+
+import numpy as np
+from nltk.sentiment.vader import VaderConstants
+
+from lexicon_scorer import load_vader_lexicon
+from sentiment import SCORERS, VaderScorer, rescale_compound_scores
+
+TOLERANCE = 0.0005
+FILLER = ["game", "the", "I", "it", "was", "is", "and", "a", "played", "hours",
+          "story", "graphics", "10/10", "devs", "multiplayer", "this", "so", "at",
+          "of", "kind", "never", "least", "but"]
+
+
+def make_reviews(reviews: int, seed: int = 0) -> list[str]:
+    """Returns reproducible reviews of filler, lexicon, booster and negation
+    words, some in capitals or followed by punctuation"""
+    random = Random(seed)
+    lexicon_words = [line.split("\t")[0] for line in load_vader_lexicon().decode().split("\n")]
+    constants = VaderConstants()
+    boosters = list(constants.BOOSTER_DICT)
+    negations = list(constants.NEGATE)
+    idioms = list(constants.SPECIAL_CASE_IDIOMS)
+    made = []
+    for _ in range(reviews):
+        words = []
+        for _ in range(random.randint(1, 40)):
+            word = random.choices([random.choice(FILLER), random.choice(lexicon_words),
+                                   random.choice(boosters), random.choice(negations),
+                                   random.choice(idioms)], weights=[60, 25, 8, 6, 1])[0]
+            if random.random() < 0.1:
+                word = word.upper()
+            if random.random() < 0.1:
+                word += random.choice(["!", "?", ",", ".", "!!", "??", "!?!", " :)"])
+            words.append(word)
+        made.append(" ".join(words))
+    return made
+
+
+def time_scorer(scorer, reviews: list[str]) -> tuple[float, np.ndarray]:
+    """Returns how long a scorer takes over the reviews, and its scores"""
+    time_started = perf_counter()
+    scores = scorer.score(reviews)
+    return perf_counter() - time_started, scores
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--reviews", type=int, default=100_000)
+    parser.add_argument("--reviews-file", help="score these reviews, one per line")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="worker processes for the VADER reference")
+    args = parser.parse_args()
+
+    if args.reviews_file:
+        with open(args.reviews_file, encoding="utf-8") as file:
+            review_text = file.read().splitlines()
+    else:
+        review_text = make_reviews(args.reviews)
+    print(f"{len(review_text)} reviews")
+
+    vader_seconds, vader_scores = time_scorer(VaderScorer(args.processes), review_text)
+    vader_ratings = rescale_compound_scores(vader_scores)
+    print(f"vader: {vader_seconds:.2f} seconds, "
+          f"{len(review_text) / vader_seconds:,.0f} reviews a second (reference)")
+    agreed = True
+    for name, scorer_class in SCORERS.items():
+        if scorer_class is VaderScorer:
+            continue
+        seconds, scores = time_scorer(scorer_class(), review_text)
+        differences = np.abs(scores - vader_scores)
+        within = (differences <= TOLERANCE).mean()
+        agreed = agreed and within >= 0.999
+        print(f"{name}: {seconds:.2f} seconds, {len(review_text) / seconds:,.0f} reviews "
+              f"a second ({vader_seconds / seconds:.1f}x faster)")
+        print(f"  compound scores identical for {(differences == 0).mean():.4%}, "
+              f"within {TOLERANCE} for {within:.4%}, largest difference {differences.max():.4f}")
+        print(f"  ratings out of 5 identical for "
+              f"{(rescale_compound_scores(scores) == vader_ratings).mean():.4%}")
+    if not agreed:
+        raise SystemExit(1)
@@ -2,7 +2,9 @@
 
 from pytest import fixture
 from pandas import DataFrame
-from unittest.mock import MagicMock
+
+from extract import ReviewBatch
+from fake_steam import FakeSteam, run_fake_steam_server
 
 
 @fixture
@@ -25,26 +27,40 @@ def fake_df_sentiment(fake_review: str) -> DataFrame:
 
 
 @fixture
-def time_string() -> str:
-    """Returns a timestamp string for testing"""
-    return "2019-02-23 12:13:10"
+def timestamp() -> int:
+    """Returns a unix timestamp (2019-02-23 12:13:10 UTC) for testing"""
+    return 1550923990
 
 
 @fixture
-def fake_df_transform(time_string: str) -> DataFrame:
+def fake_df_transform(timestamp: int) -> DataFrame:
     """Returns data-frame used for testing"""
     return DataFrame([{"playtime_last_2_weeks": 0, "review_score": 1,
-                       "last_timestamp": time_string, "game_id": 1},
+                       "last_timestamp": timestamp, "game_id": 1},
                       {"playtime_last_2_weeks": 2, "review_score": 1,
-                       "last_timestamp": time_string, "game_id": 2}])
+                       "last_timestamp": timestamp, "game_id": 2}])
+
+
+@fixture
+def fake_steam() -> FakeSteam:
+    """Returns a fake Steam API holding 250 reviews per game"""
+    return FakeSteam()
+
+
+@fixture
+def fake_steam_url(fake_steam: FakeSteam) -> str:
+    """Runs the fake Steam API locally and returns its base url"""
+    with run_fake_steam_server(fake_steam) as url:
+        yield url
 
 
-def mock_multiprocessing() -> MagicMock:
-    "Returns a magic mock to mock multiprocessing"
-    return MagicMock()
+def fake_coroutine(value):
+    """Returns a coroutine function that ignores its arguments and returns value"""
+    async def coroutine(*args, **kwargs):
+        return value
+    return coroutine
 
 
-def mock_get_game_reviews(*args) -> list:
+async def mock_get_game_reviews(*args) -> list:
     """Returns a mock game review"""
-    test_review = {"review": "test"}
-    return [[test_review]]
+    return [ReviewBatch([1], ["test"], [0], [0], [1])]
@@ -1,16 +1,66 @@
 """Retrieves reviews for a game from game IDs"""
 
-from datetime import datetime
+from array import array
+from asyncio import Semaphore, gather, get_running_loop, run, sleep
+from hashlib import blake2b
+from itertools import repeat
+from math import ceil
 from os import environ
-from multiprocessing import Pool
-from urllib.parse import quote_plus
+from queue import Empty, Queue
+from random import uniform
+from threading import Event, Thread
+from typing import AsyncIterator, Callable, Coroutine, Iterable, Iterator, NotRequired, TypedDict
 
+from aiohttp import ClientError, ClientSession, ClientTimeout, TCPConnector
+from numpy import frombuffer, int64
 from pandas import DataFrame
 from dotenv import load_dotenv
 from psycopg2 import connect
 from psycopg2.extensions import connection
 from psycopg2.extras import RealDictCursor
-import requests
+
+from json_decoder import make_json_decoder
+from rate_limiter import wait_for_token_async
+
+
+STEAM_STORE_URL = environ.get("STEAM_STORE_URL", "https://store.steampowered.com")
+REQUEST_TIMEOUT = 10
+MAX_CONNECTIONS = int(environ.get("REVIEWS_MAX_CONNECTIONS", 20))
+MAX_CONNECTIONS_PER_HOST = int(environ.get("REVIEWS_MAX_CONNECTIONS_PER_HOST", 10))
+BUFFERED_PAGES = 10
+REVIEWS_PER_PAGE = 100
+MAX_ATTEMPTS = 6
+BACKOFF_BASE_SECONDS = 1
+BACKOFF_MAX_SECONDS = 60
+
+
+class Author(TypedDict):
+    """Author of a review in an appreviews response"""
+    playtime_forever: int
+
+
+class Review(TypedDict):
+    """The fields of a review in an appreviews response the pipeline uses"""
+    review: str
+    votes_up: int
+    timestamp_created: int
+    author: Author
+
+
+class QuerySummary(TypedDict, total=False):
+    """Summary of an appreviews response, totals are only on the first page"""
+    num_reviews: int
+    total_reviews: int
+
+
+class ReviewsResponse(TypedDict):
+    """A page of an appreviews response"""
+    cursor: str
+    reviews: list[Review]
+    query_summary: NotRequired[QuerySummary]
+
+
+decode_reviews_response = make_json_decoder(ReviewsResponse)
 
 
 class GamesNotFound(Exception):
@@ -20,80 +70,377 @@ class GamesNotFound(Exception):
         super().__init__(message)
 
 
-def get_number_of_reviews(game_id: int) -> int:
-    """Retrieves total number of all reviews from a given game ID"""
+async def get_reviews_for_game(session: ClientSession, game_id: int, cursor: str,
+                               base_url: str = STEAM_STORE_URL, since: int | None = None) -> dict:
+    """Retrieves all reviews from a given review page (cursor)
+    for a chosen game by its ID. Given a since timestamp, pages are
+    requested newest first and only reviews written after it are kept"""
+    params = {"json": "1", "num_per_page": str(REVIEWS_PER_PAGE),
+              "language": "english", "cursor": cursor}
+    if since is not None:
+        params["filter"] = "recent"
+    url = f"{base_url}/appreviews/{game_id}"
     try:
-        request = requests.get(
-            f"https://store.steampowered.com/appreviews/{game_id}?json=1", timeout=10)
-        reviews_info = request.json()
-        return reviews_info["query_summary"]["total_reviews"]
-    except requests.exceptions.Timeout:
-        return 0
+        await wait_for_token_async(url)
+        async with session.get(url, params=params) as response:
+            if response.status == 429 or response.status >= 500:
+                return {"error": f"HTTP {response.status} from Steam!", "retry": True,
+                        "retry_after": parse_retry_after(response.headers.get("Retry-After"))}
+            reviews = decode_reviews_response(await response.read())
+        next_cursor = reviews["cursor"]
 
+    except (TimeoutError, ClientError):
+        return {"error": "Timeout on the response!", "retry": True}
+    except (ValueError, KeyError, TypeError):
+        return {"error": "Invalid response from Steam!", "retry": True}
+    raw_reviews = reviews["reviews"]
+    page_reviews = ReviewBatch.from_api(raw_reviews, game_id, since)
+    return {"next_cursor": next_cursor, "reviews": page_reviews,
+            "reviews_on_page": len(raw_reviews),
+            "total_reviews": reviews.get("query_summary", {}).get("total_reviews"),
+            "newest_timestamp": max((review["timestamp_created"] for review in raw_reviews),
+                                    default=0),
+            "reached_watermark": len(page_reviews) < len(raw_reviews)}
 
-def get_reviews_for_game(game_id: int, cursor: str) -> dict:
-    """Retrieves all reviews from a given review page (cursor)
-    for a chosen game by its ID"""
-    cursor = quote_plus(cursor)
 
+def fingerprint_review(review: str, timestamp: int) -> int:
+    """Returns a 64-bit BLAKE2b fingerprint of a review's text and creation
+    time as a signed int, identifying the review however often it is fetched"""
+    digest = blake2b(f"{timestamp}:{review}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+class ReviewBatch:
+    """Reviews held as columns rather than an object per review. The numeric
+    columns are packed into arrays of 64-bit ints (creation times as unix
+    seconds), so a review costs little more than its text. Each review's
+    fingerprint is worked out once, here, for deduplication and loading"""
+
+    __slots__ = ("game_ids", "reviews", "review_scores", "timestamps", "playtimes",
+                 "review_hashes")
+
+    def __init__(self, game_ids: Iterable[int] = (), reviews: Iterable[str] = (),
+                 review_scores: Iterable[int] = (), timestamps: Iterable[int] = (),
+                 playtimes: Iterable[int] = (), review_hashes: Iterable[int] | None = None):
+        self.game_ids = array("q", game_ids)
+        self.reviews = list(reviews)
+        self.review_scores = array("q", review_scores)
+        self.timestamps = array("q", timestamps)
+        self.playtimes = array("q", playtimes)
+        if review_hashes is None:
+            review_hashes = map(fingerprint_review, self.reviews, self.timestamps)
+        self.review_hashes = array("q", review_hashes)
+
+    @classmethod
+    def from_api(cls, raw_reviews: list[dict], game_id: int,
+                 since: int | None = None) -> "ReviewBatch":
+        """Returns the reviews from an API response, keeping
+        only those written after since if given"""
+        if since is not None:
+            raw_reviews = [review for review in raw_reviews
+                           if review["timestamp_created"] > since]
+        return cls(repeat(game_id, len(raw_reviews)),
+                   [review["review"] for review in raw_reviews],
+                   [review["votes_up"] for review in raw_reviews],
+                   [review["timestamp_created"] for review in raw_reviews],
+                   [review["author"]["playtime_forever"] for review in raw_reviews])
+
+    @classmethod
+    def concat(cls, batches: Iterable["ReviewBatch"]) -> "ReviewBatch":
+        """Returns one batch holding the reviews of every batch in turn"""
+        combined = cls()
+        for batch in batches:
+            combined.extend(batch)
+        return combined
+
+    def __len__(self) -> int:
+        return len(self.reviews)
+
+    def extend(self, batch: "ReviewBatch") -> None:
+        """Adds the reviews of another batch to the end of this one"""
+        for column in self.__slots__:
+            getattr(self, column).extend(getattr(batch, column))
+
+    def take(self, start: int, stop: int | None = None) -> "ReviewBatch":
+        """Returns a batch of the reviews from start up to stop"""
+        taken = ReviewBatch()
+        for column in self.__slots__:
+            setattr(taken, column, getattr(self, column)[start:stop])
+        return taken
+
+    def to_frame(self) -> DataFrame:
+        """Returns the reviews as a data-frame with the numeric columns as int64"""
+        return DataFrame({"game_id": frombuffer(self.game_ids, dtype=int64),
+                          "review": self.reviews,
+                          "review_score": frombuffer(self.review_scores, dtype=int64),
+                          "last_timestamp": frombuffer(self.timestamps, dtype=int64),
+                          "playtime_last_2_weeks": frombuffer(self.playtimes, dtype=int64),
+                          "review_hash": frombuffer(self.review_hashes, dtype=int64)})
+
+
+def parse_retry_after(header: str | None) -> float | None:
+    """Returns the seconds asked for in a Retry-After header, if given as seconds"""
     try:
-        request = requests.get(f"""https://store.steampowered.com/appreviews/
-                {game_id}?json=1&num_per_page=100&language=english&cursor={cursor}""", timeout=10)
-        reviews = request.json()
-        next_cursor = reviews["cursor"]
+        return float(header)
+    except (TypeError, ValueError):
+        return None
+
+
+class ReviewPager:
+    """Follows the review cursors of one game, page by page.
+    Seen cursors are kept in a set to detect the cursor chain looping back,
+    failed requests are retried with capped exponential backoff and jitter,
+    and the position can be saved with state() and resumed with from_state()"""
+
+    def __init__(self, game_id: int, since: int | None = None):
+        self.game_id = game_id
+        self.since = since
+        self.cursor = "*"
+        self.seen_cursors = set()
+        self.total_reviews = None
+        self.reviews_seen = 0
+        self.newest_timestamp = 0
+        self.attempts = 0
+        self.finished = False
+        self.failed = False
+
+    def state(self) -> dict:
+        """Returns the pager's position as JSON serialisable values"""
+        return {"game_id": self.game_id, "since": self.since, "cursor": self.cursor,
+                "seen_cursors": sorted(self.seen_cursors),
+                "total_reviews": self.total_reviews, "reviews_seen": self.reviews_seen,
+                "newest_timestamp": self.newest_timestamp, "finished": self.finished,
+                "failed": self.failed}
 
-    except requests.exceptions.Timeout:
-        return {"error": "Timeout on the response!"}
-    page_reviews = []
+    @classmethod
+    def from_state(cls, state: dict) -> "ReviewPager":
+        """Returns a pager continuing from a saved position"""
+        pager = cls(state["game_id"], state["since"])
+        pager.cursor = state["cursor"]
+        pager.seen_cursors = set(state["seen_cursors"])
+        pager.total_reviews = state["total_reviews"]
+        pager.reviews_seen = state["reviews_seen"]
+        pager.newest_timestamp = state["newest_timestamp"]
+        pager.finished = state["finished"]
+        pager.failed = state["failed"]
+        return pager
 
-    for review in reviews["reviews"]:
-        review_dict = {}
-        review_dict["game_id"] = game_id
-        review_dict["review"] = review["review"]
-        review_dict["review_score"] = review["votes_up"]
-        review_dict["last_timestamp"] = datetime.fromtimestamp(
-            review["timestamp_created"]).strftime("%Y-%m-%d %H:%M:%S")
-        review_dict["playtime_last_2_weeks"] = review["author"]["playtime_forever"]
-        page_reviews.append(review_dict)
-    return {"next_cursor": next_cursor, "reviews": page_reviews}
+    def backoff_delay(self, retry_after: float | None = None) -> float:
+        """Returns seconds to wait before the next attempt, drawn at random up to
+        a cap that doubles with each failed attempt, and at least retry_after"""
+        cap = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** self.attempts)
+        return max(uniform(0, cap), retry_after or 0)
 
+    def advance(self, api_response: dict) -> ReviewBatch:
+        """Moves the pager on past a successful response,
+        returning the reviews to hand on"""
+        if not self.seen_cursors:
+            self.total_reviews = api_response.get("total_reviews")
+            if self.total_reviews:
+                planned_pages = ceil(self.total_reviews / REVIEWS_PER_PAGE)
+                print(f"Game {self.game_id}: {self.total_reviews} reviews "
+                      f"over {planned_pages} pages.")
+        self.attempts = 0
+        self.seen_cursors.add(self.cursor)
+        next_cursor = api_response["next_cursor"]
+        page_reviews = api_response["reviews"]
+        self.reviews_seen += api_response.get("reviews_on_page", len(page_reviews))
+        self.newest_timestamp = max(self.newest_timestamp,
+                                    api_response.get("newest_timestamp", 0))
+        if not len(page_reviews) or next_cursor in self.seen_cursors:
+            self.finished = True
+            return ReviewBatch()
+        self.cursor = next_cursor
+        if api_response.get("reached_watermark") or (
+                self.total_reviews is not None and self.reviews_seen >= self.total_reviews):
+            self.finished = True
+        return page_reviews
 
-def get_game_reviews(game: int) -> list:
+    async def pages(self, session: ClientSession,
+                    base_url: str = STEAM_STORE_URL) -> AsyncIterator[ReviewBatch]:
+        """Yields each page of reviews until the game is exhausted"""
+        while not self.finished:
+            api_response = await get_reviews_for_game(
+                session, self.game_id, self.cursor, base_url, self.since)
+            if "error" in api_response:
+                if not api_response.get("retry") or self.attempts >= MAX_ATTEMPTS:
+                    print(f"Game {self.game_id}: giving up, {api_response['error']}")
+                    self.finished = self.failed = True
+                    return
+                await sleep(self.backoff_delay(api_response.get("retry_after")))
+                self.attempts += 1
+                continue
+            page_reviews = self.advance(api_response)
+            if len(page_reviews):
+                yield page_reviews
+
+
+async def iter_game_reviews(session: ClientSession, game: int,
+                            base_url: str = STEAM_STORE_URL,
+                            watermarks: dict[int, int] | None = None
+                            ) -> AsyncIterator[ReviewBatch]:
+    """Yields each page of reviews for a game as it arrives.
+    The total number of reviews is read from the first page and paging
+    stops as soon as that many have been seen.
+    Given watermarks, only reviews newer than the game's watermark are
+    fetched and, once every page has been fetched, the watermark is moved
+    up to the newest review seen. A game given up on partway keeps its
+    watermark, as pages come newest first and older ones would be skipped"""
+    since = None if watermarks is None else watermarks.get(game, 0)
+    pager = ReviewPager(game, since)
+    async for page_reviews in pager.pages(session, base_url):
+        yield page_reviews
+    if (watermarks is not None and pager.finished and not pager.failed
+            and pager.newest_timestamp > since):
+        watermarks[game] = pager.newest_timestamp
+
+
+async def get_game_reviews(session: ClientSession, game: int,
+                           base_url: str = STEAM_STORE_URL,
+                           watermarks: dict[int, int] | None = None) -> list:
     """Retrieves game reviews to be combined into a list together"""
-    number_of_total_reviews = get_number_of_reviews(game)
-    all_reviews = []
-    if number_of_total_reviews:
-        cursor_list = []
-        cursor = "*"
-
-        while cursor not in cursor_list:
-            cursor_list.append(cursor)
-            api_response = get_reviews_for_game(game, cursor)
-            if "error" not in api_response:
-                cursor = api_response["next_cursor"]
-                page_reviews = api_response["reviews"]
-                if not page_reviews or cursor in cursor_list:
-                    return all_reviews
-                all_reviews.append(page_reviews)
-    return all_reviews
-
-
-def get_all_reviews(game_ids: list[int]) -> DataFrame:
+    return [page async for page in iter_game_reviews(session, game, base_url, watermarks)]
+
+
+def create_session(max_connections: int = MAX_CONNECTIONS,
+                   max_connections_per_host: int = MAX_CONNECTIONS_PER_HOST) -> ClientSession:
+    """Returns a HTTP session sharing a pool of keep-alive connections,
+    capped overall and per host"""
+    connector = TCPConnector(limit=max_connections,
+                             limit_per_host=max_connections_per_host)
+    return ClientSession(connector=connector,
+                         timeout=ClientTimeout(total=REQUEST_TIMEOUT))
+
+
+async def get_all_reviews_async(game_ids: list[int], base_url: str = STEAM_STORE_URL,
+                                max_connections: int = MAX_CONNECTIONS,
+                                max_connections_per_host: int = MAX_CONNECTIONS_PER_HOST,
+                                watermarks: dict[int, int] | None = None) -> list:
+    """Crawls the reviews of every game concurrently over one session,
+    returning the pages of each game in the order of game_ids"""
+    async with create_session(max_connections, max_connections_per_host) as session:
+        return await gather(*(get_game_reviews(session, game_id, base_url, watermarks)
+                              for game_id in game_ids))
+
+
+def get_all_reviews(game_ids: list[int], base_url: str = STEAM_STORE_URL,
+                    watermarks: dict[int, int] | None = None) -> DataFrame:
     """Combines all reviews together
-    with the use of multiprocessing"""
-    list_of_reviews = []
+    with the use of asynchronous requests"""
+    reviews_data = run(get_all_reviews_async(game_ids, base_url, watermarks=watermarks))
+    return ReviewBatch.concat(page for game_pages in reviews_data for page in game_pages).to_frame()
+
+
+async def put_review_pages(game_ids: list[int], pages: Queue, stopped: Event,
+                           base_url: str = STEAM_STORE_URL,
+                           watermarks: dict[int, int] | None = None) -> None:
+    """Crawls every game, handing each page to the queue as it arrives.
+    Only as many games as there are connections are crawled at once, and a
+    full queue pauses the crawl, so few pages are ever held in memory"""
+    loop = get_running_loop()
+    games_in_flight = Semaphore(MAX_CONNECTIONS)
+
+    async def crawl(session: ClientSession, game_id: int) -> None:
+        async with games_in_flight:
+            if stopped.is_set():
+                return
+            async for page in iter_game_reviews(session, game_id, base_url, watermarks):
+                if stopped.is_set():
+                    return
+                await loop.run_in_executor(None, pages.put, page)
+                # Checked again before the next page is requested
+                if stopped.is_set():
+                    return
 
-    with Pool() as p:
-        reviews_data = p.map(get_game_reviews, game_ids)
+    async with create_session() as session:
+        await gather(*(crawl(session, game_id) for game_id in game_ids))
 
-    for set_reviews in reviews_data:
-        list_of_reviews.extend(set_reviews)
 
-    returned_reviews = []
-    for reviews in list_of_reviews:
-        returned_reviews.extend(reviews)
+async def put_pager_pages(pagers: list[ReviewPager], pages: Queue, stopped: Event,
+                          base_url: str = STEAM_STORE_URL) -> None:
+    """Crawls every pager at once, handing the queue (state, page) pairs where
+    state is the pager's position once the page is done. Each pager ends with
+    its final state and an empty page"""
+    loop = get_running_loop()
 
-    return DataFrame(returned_reviews)
+    async def crawl(session: ClientSession, pager: ReviewPager) -> None:
+        async for page in pager.pages(session, base_url):
+            if stopped.is_set():
+                return
+            await loop.run_in_executor(None, pages.put, (pager.state(), page))
+            if stopped.is_set():
+                return
+        await loop.run_in_executor(None, pages.put,
+                                   (pager.state(), ReviewBatch()))
+
+    async with create_session() as session:
+        await gather(*(crawl(session, pager) for pager in pagers))
+
+
+def iter_in_background(put_pages: Callable[[Queue, Event], Coroutine],
+                       buffered_pages: int = BUFFERED_PAGES) -> Iterator:
+    """Yields what put_pages puts on the queue while it carries on in a background thread"""
+    pages = Queue(maxsize=buffered_pages)
+    stopped = Event()
+    finished = object()
+
+    def produce() -> None:
+        try:
+            run(put_pages(pages, stopped))
+            pages.put(finished)
+        except Exception as err:  # pylint: disable=broad-except
+            pages.put(err)
+
+    producer = Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while (page := pages.get()) is not finished:
+            if isinstance(page, Exception):
+                raise page
+            yield page
+    finally:
+        stopped.set()
+        while producer.is_alive():
+            try:
+                pages.get(timeout=0.1)
+            except Empty:
+                pass
+
+
+def iter_review_pages(game_ids: list[int], base_url: str = STEAM_STORE_URL,
+                      buffered_pages: int = BUFFERED_PAGES,
+                      watermarks: dict[int, int] | None = None) -> Iterator[ReviewBatch]:
+    """Yields pages of reviews while the crawl carries on in a background thread"""
+    return iter_in_background(
+        lambda pages, stopped: put_review_pages(game_ids, pages, stopped, base_url, watermarks),
+        buffered_pages)
+
+
+def iter_pager_pages(pagers: list[ReviewPager], base_url: str = STEAM_STORE_URL,
+                     buffered_pages: int = BUFFERED_PAGES
+                     ) -> Iterator[tuple[dict, ReviewBatch]]:
+    """Yields (state, page) pairs from each pager while the crawl carries
+    on in a background thread, see put_pager_pages"""
+    return iter_in_background(
+        lambda pages, stopped: put_pager_pages(pagers, pages, stopped, base_url),
+        buffered_pages)
+
+
+def iter_review_chunks(game_ids: list[int], chunk_size: int,
+                       base_url: str = STEAM_STORE_URL,
+                       watermarks: dict[int, int] | None = None) -> Iterator[DataFrame]:
+    """Yields data-frames of at most chunk_size reviews"""
+    chunk = ReviewBatch()
+    for page in iter_review_pages(game_ids, base_url, watermarks=watermarks):
+        chunk.extend(page)
+        if len(chunk) < chunk_size:
+            continue
+        chunks_ready = len(chunk) - len(chunk) % chunk_size
+        for start in range(0, chunks_ready, chunk_size):
+            yield chunk.take(start, start + chunk_size).to_frame()
+        chunk = chunk.take(chunks_ready)
+    if chunk:
+        yield chunk.to_frame()
 
 
 def get_db_connection() -> connection:
@@ -115,3 +462,35 @@ def get_game_ids(conn: connection) -> list[int] | None:
     if game_ids:
         return [game_id["app_id"] for game_id in game_ids]
     raise GamesNotFound()
+
+
+def jump_consistent_hash(key: int, num_buckets: int) -> int:
+    """Returns which of num_buckets a key falls in, using Lamping and Veach's
+    jump consistent hash. Adding a bucket only moves 1/num_buckets of the keys"""
+    bucket, jump = -1, 0
+    key &= 0xFFFFFFFFFFFFFFFF
+    while jump < num_buckets:
+        bucket = jump
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        jump = int((bucket + 1) * (2 ** 31 / ((key >> 33) + 1)))
+    return bucket
+
+
+def select_shard(game_ids: list[int], shard: int, num_shards: int) -> list[int]:
+    """Returns the game IDs belonging to one of num_shards shards (numbered from 0),
+    so identical tasks given different shards split the games between them"""
+    game_ids = [game_id for game_id in game_ids
+                if jump_consistent_hash(game_id, num_shards) == shard]
+    if game_ids:
+        return game_ids
+    raise GamesNotFound(f"No new games in shard {shard}/{num_shards}!")
+
+
+def get_review_watermarks(conn: connection, game_ids: list[int]) -> dict[int, int]:
+    """Returns the timestamp of the newest review already
+    extracted for each game that has been extracted before"""
+    with conn.cursor() as cur:
+        cur.execute("""SELECT app_id, newest_timestamp FROM review_watermark
+    WHERE app_id = ANY(%s)""", (game_ids,))
+        watermarks = cur.fetchall()
+    return {watermark["app_id"]: watermark["newest_timestamp"] for watermark in watermarks}
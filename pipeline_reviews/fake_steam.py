@@ -0,0 +1,106 @@
+"""Local fake of the Steam appreviews endpoint for offline tests and benchmarks"""
+
+import asyncio
+from collections import Counter
+from contextlib import contextmanager
+import socket
+from threading import Event, Thread
+from typing import Iterator
+
+from aiohttp import web
+
+
+REVIEWS_PER_PAGE = 100
+FIRST_TIMESTAMP = 1693872000
+
+
+class FakeSteam:
+    """Serves deterministic review pages for any app ID and counts the requests made"""
+
+    def __init__(self, reviews_per_game: dict[int, int] | None = None,
+                 default_reviews: int = 250, latency: float = 0.0,
+                 rate_limited_requests: int = 0, failing_cursors: set[str] | None = None):
+        self.reviews_per_game = reviews_per_game or {}
+        self.failing_cursors = failing_cursors or set()
+        self.default_reviews = default_reviews
+        self.latency = latency
+        self.rate_limited_requests = rate_limited_requests
+        self.requests = Counter()
+
+    def total_reviews(self, game_id: int) -> int:
+        """Returns the number of reviews the fake holds for a game"""
+        return self.reviews_per_game.get(game_id, self.default_reviews)
+
+    def make_review(self, game_id: int, position: int) -> dict:
+        """Returns a review in the shape the Steam API sends it"""
+        return {"review": f"Review {position} of game {game_id}",
+                "votes_up": position % 7,
+                "timestamp_created": FIRST_TIMESTAMP - position * 60,
+                "author": {"playtime_forever": 10 + position % 50}}
+
+    def make_page(self, game_id: int, cursor: str, num_per_page: int) -> dict:
+        """Returns the response body for a page of reviews, cursors
+        are of the form 'AoJ/<offset>+=' to exercise url quoting"""
+        offset = 0 if cursor == "*" else int(cursor[4:-2])
+        total = self.total_reviews(game_id)
+        end = min(offset + num_per_page, total)
+        page = {"success": 1,
+                "query_summary": {"num_reviews": end - offset},
+                "reviews": [self.make_review(game_id, position)
+                            for position in range(offset, end)],
+                "cursor": f"AoJ/{end}+="}
+        if cursor == "*":
+            page["query_summary"]["total_reviews"] = total
+        return page
+
+    async def handle_reviews(self, request: web.Request) -> web.Response:
+        """Handles GET /appreviews/{game_id}, answering the
+        first rate_limited_requests for each game with HTTP 429
+        and any request for a failing cursor with HTTP 500"""
+        game_id = int(request.match_info["game_id"])
+        self.requests[game_id] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.requests[game_id] <= self.rate_limited_requests:
+            return web.Response(status=429, headers={"Retry-After": "0"})
+        cursor = request.query.get("cursor", "*")
+        if cursor in self.failing_cursors:
+            return web.Response(status=500)
+        num_per_page = int(request.query.get(
+            "num_per_page", REVIEWS_PER_PAGE))
+        return web.json_response(self.make_page(game_id, cursor, num_per_page))
+
+    def make_app(self) -> web.Application:
+        """Returns the aiohttp application serving the fake endpoints"""
+        app = web.Application()
+        app.router.add_get("/appreviews/{game_id}", self.handle_reviews)
+        return app
+
+
+@contextmanager
+def run_fake_steam_server(fake: FakeSteam) -> Iterator[str]:
+    """Runs the fake Steam server on a background thread,
+    yielding the base url to point the extract functions at"""
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(fake.make_app(), access_log=None)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    started = Event()
+
+    def serve() -> None:
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(runner.setup())
+        loop.run_until_complete(web.SockSite(runner, sock).start())
+        started.set()
+        loop.run_forever()
+
+    thread = Thread(target=serve, daemon=True)
+    thread.start()
+    started.wait()
+    try:
+        yield f"http://127.0.0.1:{sock.getsockname()[1]}"
+    finally:
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
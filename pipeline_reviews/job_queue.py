@@ -0,0 +1,149 @@
+"""Durable queue of per-game extraction jobs, so a crawl that dies partway
+resumes from its saved cursors and several workers can share out the games"""
+
+from abc import ABC, abstractmethod
+from datetime import date
+import json
+from os import environ, getpid
+from socket import gethostname
+import sqlite3
+from time import time
+
+from psycopg2.extensions import connection, cursor
+
+
+JOB_LEASE_SECONDS = int(environ.get("JOB_LEASE_SECONDS", 600))
+MAX_JOB_ATTEMPTS = int(environ.get("MAX_JOB_ATTEMPTS", 3))
+
+CLAIM_JOBS = """UPDATE extraction_job SET status = 'running', attempts = attempts + 1,
+    claimed_by = %s, lease_expires_at = %s
+    WHERE (run_id, app_id) IN (
+        SELECT run_id, app_id FROM extraction_job
+        WHERE run_id = %s AND attempts < %s
+        AND (status = 'pending' OR (status = 'running' AND lease_expires_at < %s))
+        ORDER BY app_id LIMIT %s FOR UPDATE SKIP LOCKED)
+    RETURNING pager_state"""
+
+
+def get_worker_id() -> str:
+    """Returns a name for this worker, unique across hosts and processes"""
+    return f"{gethostname()}-{getpid()}"
+
+
+def get_run_id() -> str:
+    """Returns the run jobs belong to. Runs restarted on the same
+    day carry on the same jobs, the next day's run starts afresh"""
+    return environ.get("EXTRACTION_RUN_ID", date.today().isoformat())
+
+
+class JobQueue(ABC):
+    """Jobs kept in the extraction_job table, one per game per run, holding
+    each game's status, attempts and pager state. Claimed jobs are leased to a
+    worker, and a job whose worker stops saving progress for longer than the
+    lease is handed to another worker, carrying on from the saved cursor"""
+
+    def __init__(self, conn, run_id: str | None = None,
+                 lease_seconds: float = JOB_LEASE_SECONDS,
+                 max_attempts: int = MAX_JOB_ATTEMPTS):
+        self.conn = conn
+        self.run_id = run_id or get_run_id()
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+    @abstractmethod
+    def execute(self, sql: str, params: list[tuple]) -> list[tuple]:
+        """Runs sql once for each set of params in one transaction, returning the rows"""
+
+    def enqueue(self, pager_states: list[dict]) -> None:
+        """Adds a pending job for each game not already in this run"""
+        self.execute("""INSERT INTO extraction_job (run_id, app_id, status, attempts, pager_state)
+            VALUES (%s, %s, 'pending', 0, %s) ON CONFLICT DO NOTHING""",
+                     [(self.run_id, state["game_id"], json.dumps(state))
+                      for state in pager_states])
+
+    def claim(self, worker_id: str, limit: int) -> list[dict]:
+        """Leases up to limit jobs to the worker, returning their pager states"""
+        now = time()
+        rows = self.execute(CLAIM_JOBS, [(worker_id, now + self.lease_seconds, self.run_id,
+                                          self.max_attempts, now, limit)])
+        pager_states = [json.loads(row[0]) if isinstance(row[0], str) else row[0]
+                        for row in rows]
+        for state in pager_states:
+            state["finished"] = state["failed"] = False
+        return sorted(pager_states, key=lambda state: state["game_id"])
+
+    def save(self, pager_states: list[dict]) -> None:
+        """Records the position of each game, only to be called once the reviews
+        before it are committed. Unfinished jobs have their lease renewed,
+        failed jobs go back to pending until out of attempts"""
+        self.execute("""UPDATE extraction_job SET pager_state = %s, lease_expires_at = %s,
+            status = CASE WHEN %s THEN 'done' WHEN NOT %s THEN 'running'
+                WHEN attempts < %s THEN 'pending' ELSE 'failed' END
+            WHERE run_id = %s AND app_id = %s""",
+                     [(json.dumps(state), time() + self.lease_seconds,
+                       state["finished"] and not state["failed"], state["failed"],
+                       self.max_attempts, self.run_id, state["game_id"])
+                      for state in pager_states])
+
+    def count_by_status(self) -> dict[str, int]:
+        """Returns how many of this run's jobs have each status"""
+        rows = self.execute("""SELECT status, COUNT(*) FROM extraction_job
+            WHERE run_id = %s GROUP BY status""", [(self.run_id,)])
+        return dict(rows)
+
+
+class PostgresJobQueue(JobQueue):
+    """Job queue shared by every worker through the pipeline's database.
+    Jobs are claimed with SELECT ... FOR UPDATE SKIP LOCKED so workers
+    claiming at the same time never wait on, or take, each other's games"""
+
+    def execute(self, sql: str, params: list[tuple]) -> list[tuple]:
+        rows = []
+        try:
+            with self.conn.cursor(cursor_factory=cursor) as cur:
+                for row_params in params:
+                    cur.execute(sql, row_params)
+                    if cur.description:
+                        rows.extend(cur.fetchall())
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        return rows
+
+
+class SQLiteJobQueue(JobQueue):
+    """Stand-in job queue in a local SQLite file, for running and testing
+    without Postgres. SQLite has no row locks, so claims take the
+    database's write lock instead, which serialises workers' claims"""
+
+    def __init__(self, path: str, run_id: str | None = None,
+                 lease_seconds: float = JOB_LEASE_SECONDS,
+                 max_attempts: int = MAX_JOB_ATTEMPTS):
+        conn = sqlite3.connect(path, isolation_level=None, timeout=30)
+        conn.execute("""CREATE TABLE IF NOT EXISTS extraction_job (
+            run_id TEXT NOT NULL, app_id INTEGER NOT NULL, status TEXT NOT NULL,
+            attempts INTEGER NOT NULL, pager_state TEXT NOT NULL,
+            claimed_by TEXT, lease_expires_at REAL, PRIMARY KEY (run_id, app_id))""")
+        super().__init__(conn, run_id, lease_seconds, max_attempts)
+
+    def execute(self, sql: str, params: list[tuple]) -> list[tuple]:
+        sql = sql.replace(" FOR UPDATE SKIP LOCKED", "").replace("%s", "?")
+        rows = []
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            for row_params in params:
+                rows.extend(self.conn.execute(sql, row_params).fetchall())
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return rows
+
+
+def open_job_queue(conn: connection) -> JobQueue:
+    """Returns the SQLite job queue at JOB_QUEUE_PATH if set,
+    otherwise the queue in the pipeline's database"""
+    if environ.get("JOB_QUEUE_PATH"):
+        return SQLiteJobQueue(environ["JOB_QUEUE_PATH"])
+    return PostgresJobQueue(conn)
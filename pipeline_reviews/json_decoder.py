@@ -0,0 +1,42 @@
+"""Pluggable JSON decoding for Steam API payloads. msgspec decodes straight from
+the response bytes into a schema, validating the payload and only building the
+fields the schema names. orjson, then the standard library, are used instead
+(without validation) when it is not installed, or when chosen with JSON_DECODER"""
+
+import json
+from os import environ
+from typing import Any, Callable
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def get_default_decoder() -> str:
+    """Returns the fastest JSON decoder installed"""
+    if msgspec is not None:
+        return "msgspec"
+    if orjson is not None:
+        return "orjson"
+    return "json"
+
+
+JSON_DECODER = environ.get("JSON_DECODER", get_default_decoder())
+
+
+def make_json_decoder(schema: Any = Any, decoder: str = JSON_DECODER) -> Callable[[bytes], Any]:
+    """Returns a function decoding JSON bytes, into schema (a TypedDict, so the
+    result is plain dicts and lists whichever decoder is used) with msgspec.
+    Invalid JSON, or with msgspec JSON not matching the schema, raises ValueError"""
+    if decoder == "msgspec" and msgspec is not None:
+        return msgspec.json.Decoder(schema).decode
+    if decoder == "orjson" and orjson is not None:
+        return orjson.loads
+    if decoder == "json":
+        return json.loads
+    raise ValueError(f"JSON decoder {decoder} is not available")
@@ -0,0 +1,269 @@
+"""Batched sentiment scorer interface and a vectorised VADER lexicon scorer"""
+
+from abc import ABC, abstractmethod
+from functools import cache
+from hashlib import sha256
+from itertools import chain
+import re
+import string
+
+import nltk
+import numpy as np
+from nltk.sentiment.vader import VaderConstants
+
+
+VADER_LEXICON = "sentiment/vader_lexicon.zip/vader_lexicon/vader_lexicon.txt"
+
+# Bump whenever LexiconScorer's rules change, so cached scores are not reused
+LEXICON_RULES_VERSION = 1
+
+VADER = VaderConstants()
+# Where NLTK looks for idioms around a word, as (offset of the first word,
+# number of words), in reverse order of precedence then the two overrides
+IDIOM_PLACEMENTS = [(3, 2), (3, 3), (2, 2), (2, 3), (1, 2), (0, 2), (0, 3)]
+PUNCTUATION = frozenset(string.punctuation)
+# A token with VADER punctuation on one side of a word has the punctuation dropped
+EDGE_PUNCTUATION = re.compile(
+    "^(?:{punc})([^{chars}]{{2,}})$|^([^{chars}]{{2,}})(?:{punc})$".format(
+        punc="|".join(re.escape(punc) for punc in sorted(VADER.PUNC_LIST, key=len, reverse=True)),
+        chars=re.escape(string.punctuation)))
+
+
+@cache
+def load_vader_lexicon() -> bytes:
+    """Returns the VADER lexicon file installed with the NLTK data"""
+    return nltk.data.load(VADER_LEXICON, format="raw")
+
+
+def get_lexicon_digest() -> str:
+    """Returns a short digest of the VADER lexicon file"""
+    return sha256(load_vader_lexicon()).hexdigest()[:16]
+
+
+class SentimentScorer(ABC):
+    """Works out VADER-style compound scores, from -1 to 1, for a batch of
+    review texts at once. Scores are cached under the scorer's version"""
+
+    name = ""
+
+    @property
+    @abstractmethod
+    def version(self) -> str:
+        """Names the rules and lexicon the scores come from"""
+
+    @abstractmethod
+    def score(self, texts: list[str]) -> np.ndarray:
+        """Returns the compound score of each text as a float array, in order"""
+
+
+def strip_punctuation(token: str) -> str | None:
+    """Returns a whitespace separated token as one of VADER's words and
+    emoticons, without any punctuation on one side of a word, or None if
+    the token is too short to count"""
+    if len(token) < 2:
+        return None
+    if token[0] in PUNCTUATION or token[-1] in PUNCTUATION:
+        match = EDGE_PUNCTUATION.match(token)
+        if match:
+            return match.group(1) or match.group(2)
+    return token
+
+
+class TokenBatch:
+    """The words of a batch of texts flattened into arrays, each word knowing
+    its text, its position in it, an ID of its exact spelling and its
+    vocabulary ID. Work on the words themselves is done once per distinct
+    spelling. Shifting an array lines each word up with a word before
+    (or after) it, so VADER's look-backs become array comparisons"""
+
+    def __init__(self, texts: list[str], vocabulary: dict[str, int]):
+        text_tokens = [text.split() for text in texts]
+        tokens = list(chain.from_iterable(text_tokens))
+        token_ids = {token: token_id for token_id, token in enumerate(dict.fromkeys(tokens))}
+        words = [strip_punctuation(token) for token in token_ids]
+        self.spellings = {word: word_id for word_id, word
+                          in enumerate(dict.fromkeys(word for word in words if word))}
+        spelling_of_token = np.array([self.spellings.get(word, -1) for word in words],
+                                     dtype=np.int64)
+        spelling_ids = spelling_of_token[np.fromiter(
+            map(token_ids.__getitem__, tokens), dtype=np.int64, count=len(tokens))]
+        counted = spelling_ids >= 0
+        self.spelling_ids = spelling_ids[counted]
+        self.size = len(self.spelling_ids)
+
+        lowered = [word.lower() for word in self.spellings]
+        self.ids = np.array([vocabulary.get(word, 0) for word in lowered],
+                            dtype=np.int64)[self.spelling_ids]
+        self.upper = np.array([word.isupper() for word in self.spellings],
+                              dtype=bool)[self.spelling_ids]
+        self.contains_nt = np.array(["n't" in word for word in lowered],
+                                    dtype=bool)[self.spelling_ids]
+
+        token_counts = np.fromiter(map(len, text_tokens), dtype=np.int64, count=len(texts))
+        self.text_of = np.repeat(np.arange(len(texts)), token_counts)[counted]
+        self.lengths = np.bincount(self.text_of, minlength=len(texts))
+        starts = np.cumsum(self.lengths) - self.lengths
+        self.positions = np.arange(self.size) - starts[self.text_of]
+        self.remaining = self.lengths[self.text_of] - self.positions - 1
+
+    def shift(self, values: np.ndarray, offset: int) -> np.ndarray:
+        """Returns values lined up so each word sees the one offset before it,
+        or after it if offset is negative. Words without one that far away in
+        their own text see another text's, so must be masked with has_word"""
+        if offset > 0:
+            return np.concatenate([values[:offset], values[:-offset]])
+        if offset < 0:
+            return np.concatenate([values[-offset:], values[offset:]])
+        return values
+
+    def has_word(self, offset: int) -> np.ndarray:
+        """Returns where there is a word offset before (or after) in the same text"""
+        return self.positions >= offset if offset >= 0 else self.remaining >= -offset
+
+    def is_spelt(self, offset: int, *words: str) -> np.ndarray:
+        """Returns where the word offset before is spelt exactly as one of words"""
+        spelling_ids = self.shift(self.spelling_ids, offset)
+        spelt = np.zeros(self.size, dtype=bool)
+        for word in words:
+            if word in self.spellings:
+                spelt |= spelling_ids == self.spellings[word]
+        return spelt
+
+    def is_sequence(self, phrase: str, first_offset: int) -> np.ndarray:
+        """Returns where the words of phrase are spelt out starting first_offset before"""
+        words = phrase.split(" ")
+        if not all(word in self.spellings for word in words):
+            return np.zeros(self.size, dtype=bool)
+        matched = self.has_word(first_offset) & self.has_word(first_offset - len(words) + 1)
+        for step, word in enumerate(words):
+            matched &= self.is_spelt(first_offset - step, word)
+        return matched
+
+
+class LexiconScorer(SentimentScorer):
+    """VADER compound scores worked out for the whole batch with array
+    operations. Words are hashed into a vocabulary compiled once from the
+    lexicon, booster and negation words, then each of VADER's rules for
+    capitals, boosters, negation, idioms, "least", "but" and ! and ? emphasis
+    is applied to every word of the batch at once. Like NLTK, a repeated word
+    takes the score of its first occurrence. Checked against NLTK with
+    compare_scorers.py: compound scores are within 0.0005 of NLTK's for at
+    least 99.9% of reviews, the rest differing by rounding"""
+
+    name = "lexicon"
+
+    def __init__(self, lexicon: bytes | None = None):
+        self._lexicon = lexicon
+        self._vocabulary = None
+        self._valence = self._in_lexicon = self._booster = self._negation = None
+
+    @property
+    def version(self) -> str:
+        lexicon = self._lexicon if self._lexicon is not None else load_vader_lexicon()
+        return f"lexicon-{LEXICON_RULES_VERSION}-{sha256(lexicon).hexdigest()[:16]}"
+
+    def compile(self) -> None:
+        """Builds the vocabulary and the per-word arrays the rules look up.
+        Word 0 stands for every word outside the vocabulary"""
+        lexicon = self._lexicon if self._lexicon is not None else load_vader_lexicon()
+        valences = {}
+        for line in lexicon.decode().split("\n"):
+            word, measure = line.strip().split("\t")[0:2]
+            valences[word] = float(measure)
+        words = [""] + list(dict.fromkeys(
+            list(valences) + list(VADER.BOOSTER_DICT) + list(VADER.NEGATE)
+            + ["but", "least", "at", "very", "kind", "of"]))
+        self._vocabulary = {word: word_id for word_id, word in enumerate(words)}
+        self._valence = np.array([valences.get(word, 0.0) for word in words])
+        self._in_lexicon = np.array([word in valences for word in words])
+        self._booster = np.array([VADER.BOOSTER_DICT.get(word, 0.0) for word in words])
+        self._negation = np.array([word in VADER.NEGATE for word in words])
+
+    def is_word(self, tokens: TokenBatch, offset: int, word: str) -> np.ndarray:
+        """Returns where the word offset before is word, whatever its case"""
+        return tokens.shift(tokens.ids, offset) == self._vocabulary[word]
+
+    def apply_idioms(self, tokens: TokenBatch, valence: np.ndarray,
+                     checked: np.ndarray) -> np.ndarray:
+        """Returns valence with idioms around each checked word taking over its
+        valence, and multi-word boosters just before it damping it"""
+        for first_offset, size in IDIOM_PLACEMENTS:
+            for idiom, idiom_valence in VADER.SPECIAL_CASE_IDIOMS.items():
+                if len(idiom.split(" ")) == size:
+                    valence = np.where(checked & tokens.is_sequence(idiom, first_offset),
+                                       idiom_valence, valence)
+        for booster in (word for word in VADER.BOOSTER_DICT if " " in word):
+            damped = tokens.is_sequence(booster, 3) | tokens.is_sequence(booster, 2)
+            valence = np.where(checked & damped, valence + VADER.B_DECR, valence)
+        return valence
+
+    def word_valences(self, tokens: TokenBatch) -> np.ndarray:
+        """Returns the valence of each word in context, before the "but" rule"""
+        negated = self._negation[tokens.ids] | tokens.contains_nt
+        upper_counts = np.bincount(tokens.text_of, weights=tokens.upper,
+                                   minlength=len(tokens.lengths))
+        cap_differential = (upper_counts > 0) & (upper_counts < tokens.lengths)
+        capitalised = tokens.upper & cap_differential[tokens.text_of]
+
+        in_lexicon = self._in_lexicon[tokens.ids]
+        valence = self._valence[tokens.ids].copy()
+        valence += np.where(in_lexicon & capitalised,
+                            np.where(valence > 0, VADER.C_INCR, -VADER.C_INCR), 0)
+        for offset, weight in [(1, 1.0), (2, 0.95), (3, 0.9)]:
+            before_ids = tokens.shift(tokens.ids, offset)
+            checked = tokens.has_word(offset) & ~self._in_lexicon[before_ids]
+            boost = self._booster[before_ids] * np.where(valence < 0, -1, 1)
+            boost += np.where((boost != 0) & tokens.shift(capitalised, offset),
+                              np.where(valence > 0, VADER.C_INCR, -VADER.C_INCR), 0)
+            valence = np.where(checked, valence + boost * weight, valence)
+
+            scalar = np.where(tokens.shift(negated, offset), VADER.N_SCALAR, 1)
+            if offset == 2:
+                scalar = np.where(tokens.is_spelt(2, "never")
+                                  & tokens.is_spelt(1, "so", "this"), 1.5, scalar)
+            elif offset == 3:
+                scalar = np.where(tokens.is_spelt(3, "never") & tokens.is_spelt(2, "so", "this")
+                                  | tokens.is_spelt(1, "so", "this"), 1.25, scalar)
+            valence = np.where(checked, valence * scalar, valence)
+            if offset == 3:
+                valence = self.apply_idioms(tokens, valence, checked)
+
+        least = tokens.has_word(1) & self.is_word(tokens, 1, "least")
+        after_at_or_very = self.is_word(tokens, 2, "at") | self.is_word(tokens, 2, "very")
+        valence = np.where(least & ((tokens.positions == 1) | ~after_at_or_very),
+                           valence * VADER.N_SCALAR, valence)
+
+        kind_of = (self.is_word(tokens, 0, "kind") & tokens.has_word(-1)
+                   & self.is_word(tokens, -1, "of"))
+        return np.where(in_lexicon & ~kind_of & (self._booster[tokens.ids] == 0), valence, 0)
+
+    def score(self, texts: list[str]) -> np.ndarray:
+        if self._vocabulary is None:
+            self.compile()
+        tokens = TokenBatch(texts, self._vocabulary)
+        valence = self.word_valences(tokens)
+
+        # Each word is scored where the same word first appears in its text
+        _, first_index, inverse = np.unique(
+            tokens.text_of * len(tokens.spellings) + tokens.spelling_ids,
+            return_index=True, return_inverse=True)
+        valence = valence[first_index[inverse.ravel()]]
+
+        is_but = self.is_word(tokens, 0, "but")
+        first_but = np.full(len(texts), tokens.size)
+        np.minimum.at(first_but, tokens.text_of[is_but], tokens.positions[is_but])
+        but_at = first_but[tokens.text_of]
+        has_but = but_at < tokens.size
+        valence *= np.where(has_but & (tokens.positions < but_at), 0.5,
+                            np.where(has_but & (tokens.positions > but_at), 1.5, 1))
+
+        totals = np.bincount(tokens.text_of, weights=valence,
+                             minlength=len(texts)).astype(np.float64)
+        exclamations = np.fromiter((text.count("!") for text in texts), dtype=np.int64,
+                                   count=len(texts))
+        questions = np.fromiter((text.count("?") for text in texts), dtype=np.int64,
+                                count=len(texts))
+        emphasis = np.minimum(exclamations, 4) * 0.292 + np.where(
+            questions > 3, 0.96, np.where(questions > 1, questions * 0.18, 0))
+        totals += np.sign(totals) * emphasis
+        return np.round(totals / np.sqrt(totals * totals + 15), 4)
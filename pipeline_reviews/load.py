@@ -1,5 +1,7 @@
 """Loads reviews into the database"""
 
+from hashlib import md5
+
 from pandas import DataFrame
 from psycopg2 import Error
 from psycopg2.extensions import connection
@@ -35,15 +37,68 @@ def get_game_ids(conn: connection, app_id: int, cache: dict) -> int | None:
     return game_id
 
 
-def move_reviews_to_db(conn: connection, reviews_df: DataFrame) -> None:
-    """Moves all reviews into the database"""
+def remove_stored_reviews(conn: connection, reviews_df: DataFrame) -> DataFrame:
+    """Returns the data-frame without reviews whose fingerprint is already
+    stored for their game, so they are never scored or sent to the database.
+    Reviews stored before fingerprints were added have no review_hash, so they
+    are matched by game, text and date instead until they age out"""
+    if reviews_df.empty:
+        return reviews_df
+    text_digests = [md5(review.encode()).hexdigest() for review in reviews_df["review"]]
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""SELECT game.app_id, review.review_hash, md5(review.review_text) AS text_digest,
+        review.reviewed_at FROM review JOIN game USING (game_id) WHERE game.app_id = ANY(%s)
+        AND (review.review_hash = ANY(%s)
+        OR (review.review_hash IS NULL AND md5(review.review_text) = ANY(%s)))""",
+                        (reviews_df["game_id"].unique().tolist(),
+                         reviews_df["review_hash"].unique().tolist(),
+                         list(set(text_digests))))
+            stored = cur.fetchall()
+    except Error as err:
+        print("Error at load: ", err)
+        conn.rollback()
+        return reviews_df
+    if not stored:
+        return reviews_df
+    stored_keys = {(row["app_id"], row["review_hash"]) for row in stored}
+    legacy_keys = {(row["app_id"], row["text_digest"], row["reviewed_at"]) for row in stored
+                   if row["review_hash"] is None}
+    return reviews_df[[(game_id, review_hash) not in stored_keys
+                       and (game_id, text_digest, reviewed_at) not in legacy_keys
+                       for game_id, review_hash, text_digest, reviewed_at in zip(
+                           reviews_df["game_id"], reviews_df["review_hash"],
+                           text_digests, reviews_df["last_timestamp"])]]
+
+
+def move_reviews_to_db(conn: connection, reviews_df: DataFrame) -> bool:
+    """Moves all reviews into the database, committing them as one batch.
+    The connection is left open so it can be reused for the next batch.
+    Returns whether the reviews were committed"""
     data_to_insert = [tuple(row) for row in reviews_df.values]
     try:
         with conn.cursor() as cur:
             execute_batch(cur, """INSERT INTO review (game_id, review_text, review_score, reviewed_at,
-        playtime_last_2_weeks, sentiment) VALUES (%s, %s, %s, %s, %s, %s) ON CONFLICT DO NOTHING""", data_to_insert)
+        playtime_last_2_weeks, review_hash, sentiment) VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT DO NOTHING""", data_to_insert)
+            conn.commit()
+    except Error as err:
+        print("Error at load: ", err)
+        conn.rollback()
+        return False
+    return True
+
+
+def update_review_watermarks(conn: connection, watermarks: dict[int, int]) -> None:
+    """Stores the timestamp of the newest review extracted for each game,
+    never moving a watermark backwards"""
+    try:
+        with conn.cursor() as cur:
+            execute_batch(cur, """INSERT INTO review_watermark (app_id, newest_timestamp)
+        VALUES (%s, %s) ON CONFLICT (app_id) DO UPDATE SET
+        newest_timestamp = GREATEST(review_watermark.newest_timestamp, EXCLUDED.newest_timestamp),
+        updated_at = NOW()""", list(watermarks.items()))
             conn.commit()
     except Error as err:
         print("Error at load: ", err)
-    finally:
-        conn.close()
+        conn.rollback()
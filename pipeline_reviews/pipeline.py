@@ -1,46 +1,255 @@
 """Pipeline script to run all reviews extracting, transforming and loading"""
 
+from argparse import ArgumentParser, ArgumentTypeError
 from datetime import datetime
+from functools import partial
+from itertools import chain
+from multiprocessing import get_context
+from os import environ
 
+from pandas import DataFrame
 from psycopg2 import Error
+from psycopg2.extensions import connection
 
 from extract import get_db_connection, get_game_ids, get_all_reviews, GamesNotFound
+from extract import iter_review_chunks, get_review_watermarks, iter_pager_pages
+from extract import ReviewPager, ReviewBatch, MAX_CONNECTIONS, select_shard
+from job_queue import JobQueue, open_job_queue, get_worker_id
 from transform import transform_reviews, remove_unnamed
 from sentiment import isolate_non_stop_words, get_sentiment_values
-from load import get_game_ids_foreign_key_values, move_reviews_to_db
+from sentiment import get_sentiment_pool, SENTIMENT_PROCESSES, SENTIMENT_SCORER
+from sentiment import open_sentiment_cache
+from load import get_game_ids_foreign_key_values, move_reviews_to_db, update_review_watermarks
+from load import remove_stored_reviews
+
+DEFAULT_CHUNK_SIZE = 5000
+
+
+def load_chunk(conn: connection, reviews: DataFrame) -> tuple[bool, int]:
+    """Transforms and loads a chunk of extracted reviews,
+    returns whether it was committed and how many reviews it held"""
+    reviews = transform_reviews(reviews, conn)
+    reviews = remove_stored_reviews(conn, reviews)
+    if reviews.empty:
+        return True, 0
+    reviews = isolate_non_stop_words(reviews)
+    reviews = get_sentiment_values(reviews, sentiment_cache=open_sentiment_cache())
+    reviews = remove_unnamed(reviews)
+    reviews = get_game_ids_foreign_key_values(conn, reviews)
+    return move_reviews_to_db(conn, reviews), len(reviews)
+
+
+def run_streaming(conn: connection, game_ids: list[int], chunk_size: int,
+                  watermarks: dict[int, int] | None = None) -> bool:
+    """Extracts, transforms and loads reviews one chunk at a time so
+    memory is bounded by the chunk size, returns whether every chunk loaded"""
+    reviews_loaded = 0
+    all_loaded = True
+    chunks = iter_review_chunks(game_ids, chunk_size, watermarks=watermarks)
+    for chunk_number, reviews in enumerate(chunks, 1):
+        committed, chunk_length = load_chunk(conn, reviews)
+        all_loaded = committed and all_loaded
+        reviews_loaded += chunk_length
+        if chunk_length:
+            print(f"Loaded chunk {chunk_number} ({reviews_loaded} reviews so far).")
+    return all_loaded
+
+
+def run_batch(conn: connection, game_ids: list[int],
+              watermarks: dict[int, int] | None = None) -> bool:
+    """Extracts every review, then transforms and loads them all at once,
+    timing each step. Returns whether the reviews were committed"""
+    time_started = datetime.now()
+    reviews = get_all_reviews(game_ids, watermarks=watermarks)
+    time_finished_extract = datetime.now()
+    time_taken = time_finished_extract - time_started
+    print(f"Total extraction time: {time_taken.total_seconds()} seconds.")
+
+    print("Transforming...")
+    reviews = transform_reviews(reviews, conn)
+    time_finished_transform = datetime.now()
+    time_taken = time_finished_transform - time_finished_extract
+    print(f"Total transforming time: {time_taken.total_seconds()} seconds.")
+
+    print("Getting sentiment values...")
+    reviews = remove_stored_reviews(conn, reviews)
+    reviews = isolate_non_stop_words(reviews)
+    reviews = get_sentiment_values(reviews, sentiment_cache=open_sentiment_cache())
+    reviews = remove_unnamed(reviews)
+    time_finished_sent = datetime.now()
+    time_taken = time_finished_sent - time_finished_transform
+    print(f"Total sentiment value retrieval time: {time_taken.total_seconds()} seconds.")
+
+    print("Loading...")
+    reviews = get_game_ids_foreign_key_values(conn, reviews)
+    return move_reviews_to_db(conn, reviews)
+
+
+_worker_connection = None
+
+
+def open_worker_connection() -> None:
+    """Opens the database connection a worker process loads its reviews over"""
+    global _worker_connection  # pylint: disable=global-statement
+    _worker_connection = get_db_connection()
+
+
+def load_game_reviews(game: tuple[int, int | None], chunk_size: int) -> dict:
+    """Extracts, transforms and loads the reviews of one (game ID, watermark)
+    pair in a worker process, moving the game's watermark up once every chunk
+    is committed. Only a summary is sent back to the parent"""
+    game_id, since = game
+    watermarks = None if since is None else {game_id: since}
+    reviews_loaded = 0
+    committed = True
+    for reviews in iter_review_chunks([game_id], chunk_size, watermarks=watermarks):
+        chunk_committed, chunk_length = load_chunk(_worker_connection, reviews)
+        committed = chunk_committed and committed
+        reviews_loaded += chunk_length
+    if watermarks and committed and watermarks[game_id] > since:
+        update_review_watermarks(_worker_connection, watermarks)
+    return {"game_id": game_id, "reviews_loaded": reviews_loaded, "committed": committed}
+
+
+def run_processes(game_ids: list[int], processes: int, chunk_size: int,
+                  watermarks: dict[int, int] | None = None) -> bool:
+    """Extracts, transforms and loads games across worker processes, each loading
+    its games over its own connection. Games are handed out one at a time and
+    summaries come back as games finish, so a slow game holds up only its worker.
+    Returns whether every chunk loaded"""
+    games = [(game_id, None if watermarks is None else watermarks.get(game_id, 0))
+             for game_id in game_ids]
+    reviews_loaded = 0
+    all_loaded = True
+    # Forked workers share the parent's rate limiters
+    with get_context("fork").Pool(processes, initializer=open_worker_connection) as pool:
+        for summary in pool.imap_unordered(partial(load_game_reviews, chunk_size=chunk_size),
+                                           games):
+            all_loaded = summary["committed"] and all_loaded
+            reviews_loaded += summary["reviews_loaded"]
+            print(f"Game {summary['game_id']}: loaded {summary['reviews_loaded']} reviews "
+                  f"({reviews_loaded} so far).")
+    return all_loaded
+
+
+def save_job_progress(conn: connection, job_queue: JobQueue, pager_states: list[dict],
+                      incremental: bool) -> None:
+    """Saves the position of games whose reviews so far are committed,
+    moving up the watermark of incremental games that are done"""
+    job_queue.save(pager_states)
+    if incremental:
+        watermarks = {state["game_id"]: state["newest_timestamp"] for state in pager_states
+                      if state["finished"] and not state["failed"]
+                      and state["newest_timestamp"] > state["since"]}
+        if watermarks:
+            update_review_watermarks(conn, watermarks)
+
+
+def run_jobs(conn: connection, job_queue: JobQueue, chunk_size: int,
+             incremental: bool = False, worker_id: str | None = None) -> bool:
+    """Extracts, transforms and loads the reviews of games claimed from the job
+    queue, a batch of games at a time. Chunks hold whole pages, and each game's
+    position is saved once its pages are committed, so a worker restarted
+    after dying carries on from there. Returns whether every chunk loaded"""
+    worker_id = worker_id or get_worker_id()
+    reviews_loaded = 0
+    while pager_states := job_queue.claim(worker_id, MAX_CONNECTIONS):
+        pagers = [ReviewPager.from_state(state) for state in pager_states]
+        chunk = ReviewBatch()
+        chunk_states = {}
+        pages = iter_pager_pages(pagers)
+        # A final (None, None) flushes whatever is left of the chunk
+        for state, page in chain(pages, [(None, None)]):
+            if state is not None:
+                chunk.extend(page)
+                chunk_states[state["game_id"]] = state
+                if len(chunk) < chunk_size:
+                    continue
+            committed, chunk_length = load_chunk(conn, chunk.to_frame()) if chunk else (True, 0)
+            if not committed:
+                pages.close()
+                return False
+            save_job_progress(conn, job_queue, list(chunk_states.values()), incremental)
+            reviews_loaded += chunk_length
+            chunk = ReviewBatch()
+            chunk_states = {}
+        print(f"Loaded {reviews_loaded} reviews so far.")
+    print(f"Jobs by status: {job_queue.count_by_status()}")
+    return True
+
+
+def parse_shard(shard: str) -> tuple[int, int]:
+    """Returns the shard and number of shards from an 'i/N' argument"""
+    try:
+        index, num_shards = (int(number) for number in shard.split("/"))
+    except ValueError as err:
+        raise ArgumentTypeError("shard must be given as i/N, e.g. 0/4") from err
+    if not 0 <= index < num_shards:
+        raise ArgumentTypeError("shard i/N needs 0 <= i < N")
+    return index, num_shards
+
 
 if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--chunk-size", type=int, default=0,
+                        help="stream reviews through the pipeline in chunks of this many")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only extract reviews newer than those from previous runs")
+    parser.add_argument("--jobs", action="store_true",
+                        help="track each game in the job queue so a restarted run carries on")
+    parser.add_argument("--processes", type=int, default=0,
+                        help="load games across this many worker processes")
+    parser.add_argument("--shard", type=parse_shard, default=environ.get("REVIEWS_SHARD"),
+                        help="only extract shard i of N, split by a hash of the app ID, e.g. 0/4")
+    args = parser.parse_args()
+
+    if SENTIMENT_SCORER == "vader" and SENTIMENT_PROCESSES > 1 and not args.processes:
+        # Fork the scoring workers before the crawl starts its threads
+        get_sentiment_pool(SENTIMENT_PROCESSES)
+
     try:
         time_started = datetime.now()
         print("Extracting...")
         db_connection = get_db_connection()
         game_ids = get_game_ids(db_connection)
-        # TODO add multiprocessing for this:
-        reviews = get_all_reviews(game_ids)
-        time_finished_extract = datetime.now()
-        time_taken = time_finished_extract - time_started
-        print(f"Total extraction time: {time_taken.total_seconds()} seconds.")
-
-        print("Transforming...")
-        reviews = transform_reviews(reviews)
-        time_finished_transform = datetime.now()
-        time_taken = time_finished_transform - time_finished_extract
-        print(f"Total transforming time: {time_taken.total_seconds()} seconds.")
-
-        print("Getting sentiment values...")
-        reviews = isolate_non_stop_words(reviews)
-        reviews = get_sentiment_values(reviews)
-        reviews = remove_unnamed(reviews)
-        time_finished_sent = datetime.now()
-        time_taken = time_finished_sent - time_finished_transform
-        print(f"Total sentiment value retrieval time: {time_taken.total_seconds()} seconds.")
-
-        print("Loading...")
-        reviews = get_game_ids_foreign_key_values(db_connection, reviews)
-        move_reviews_to_db(db_connection, reviews)
-        time_finished_pipeline = datetime.now()
-        time_taken = time_finished_pipeline - time_started
-        print(f"Total time: {time_taken.total_seconds()} seconds.")
+        if args.shard:
+            game_ids = select_shard(game_ids, *args.shard)
+            print(f"Shard {args.shard[0]}/{args.shard[1]}: {len(game_ids)} games.")
+        review_watermarks = None
+        if args.incremental:
+            review_watermarks = get_review_watermarks(db_connection, game_ids)
+
+        if args.jobs:
+            job_queue = open_job_queue(db_connection)
+            job_queue.enqueue([ReviewPager(game_id, None if review_watermarks is None
+                                           else review_watermarks.get(game_id, 0)).state()
+                               for game_id in game_ids])
+            reviews_committed = run_jobs(db_connection, job_queue,
+                                         args.chunk_size or DEFAULT_CHUNK_SIZE,
+                                         args.incremental)
+            time_taken = datetime.now() - time_started
+            print(f"Total time: {time_taken.total_seconds()} seconds.")
+        elif args.processes:
+            reviews_committed = run_processes(game_ids, args.processes,
+                                              args.chunk_size or DEFAULT_CHUNK_SIZE,
+                                              review_watermarks)
+            time_taken = datetime.now() - time_started
+            print(f"Total time: {time_taken.total_seconds()} seconds.")
+        elif args.chunk_size:
+            reviews_committed = run_streaming(db_connection, game_ids,
+                                              args.chunk_size, review_watermarks)
+            time_taken = datetime.now() - time_started
+            print(f"Total time: {time_taken.total_seconds()} seconds.")
+        else:
+            reviews_committed = run_batch(db_connection, game_ids, review_watermarks)
+            time_taken = datetime.now() - time_started
+            print(f"Total time: {time_taken.total_seconds()} seconds.")
+
+        if not args.processes and (sentiment_cache := open_sentiment_cache()):
+            print(f"Sentiment cache: {sentiment_cache.stats()}")
+        if review_watermarks and reviews_committed and not (args.jobs or args.processes):
+            update_review_watermarks(db_connection, review_watermarks)
+        db_connection.close()
 
     except Error as e:
         print("Connection Error: ", e)
@@ -1,36 +1,180 @@
 """Sentiment analysis on extracted reviews"""
 
+from array import array
+import atexit
+from functools import cache
+from multiprocessing import current_process, get_context
+from multiprocessing.pool import Pool
+from os import environ
+from threading import Lock
+
+import numpy as np
 from pandas import DataFrame
+import nltk
 from nltk.corpus import stopwords
 from nltk.sentiment.vader import SentimentIntensityAnalyzer
 
+from lexicon_scorer import SentimentScorer, LexiconScorer, get_lexicon_digest
+from sentiment_cache import SentimentCache, get_sentiment_cache
+
+
+SENTIMENT_PROCESSES = int(environ.get("SENTIMENT_PROCESSES", 1))
+SENTIMENT_BATCH_SIZE = int(environ.get("SENTIMENT_BATCH_SIZE", 2000))
+SENTIMENT_SCORER = environ.get("SENTIMENT_SCORER", "vader")
+
+PUNCTUATION_AND_MORE = "/.,@£#+=_-)(*^%$~`'\"<>1023456789;:|{}[]"
+
 
-def remove_stopwords(review: str, stop_words: list[str], punctuation: list[str]) -> str:
+def make_cleaning_table(punctuation: str) -> dict[int, str | None]:
+    """Returns a str.translate table deleting the punctuation and
+    turning new lines into spaces"""
+    return str.maketrans({"\n": " "} | dict.fromkeys(punctuation))
+
+
+CLEANING_TABLE = make_cleaning_table(PUNCTUATION_AND_MORE)
+
+
+def remove_stopwords(review: str, stop_words: frozenset[str],
+                     cleaning_table: dict[int, str | None] = CLEANING_TABLE) -> str:
     """Returns review without stop words and most punctuation"""
-    review = "".join(letter for letter in review if letter not in punctuation)
-    split_review = review.replace("\n"," ").split(" ")
-    return " ".join(word for word in split_review if word.lower() not in stop_words)
+    return " ".join(word for word in review.translate(cleaning_table).split(" ")
+                    if word.lower() not in stop_words)
 
 
 def isolate_non_stop_words(reviews_df: DataFrame) -> DataFrame:
     """Returns a data-frame ready to process for sentiment scores
     with cleaned text in reviews section"""
-    stop_words = stopwords.words("english")
-    punctuation_and_more = ["/",".",",","@","£","#","+","=","_",
-            "-",")","(","*","^","%","$","~","`","'",'"',"<",">","1",
-            "0","2","3","4","5","6","7","8","9",";",":","|","{","}","[","]"]
-    reviews_df["clean_review"] = reviews_df["review"].apply(
-        lambda review: remove_stopwords(review, stop_words, punctuation_and_more))
+    stop_words = frozenset(stopwords.words("english"))
+    reviews_df["clean_review"] = [remove_stopwords(review, stop_words)
+                                  for review in reviews_df["review"]]
     return reviews_df
 
 
-def get_sentiment_values(reviews_df: DataFrame) -> DataFrame:
-    """Returns a data-frame with sentiment scores for each review"""
-    vader = SentimentIntensityAnalyzer()
-    reviews_df_copy = reviews_df.copy()
-    reviews_df_copy["sentiment"] = reviews_df_copy["clean_review"].apply(lambda review:
-                    vader.polarity_scores(review)["compound"])
-    reviews_df_copy["sentiment"] = reviews_df_copy["sentiment"].apply(
-            lambda score: round((score + 1)/2 * 5, 1))
-    reviews_df_copy.drop(columns=["clean_review"], inplace=True)
-    return reviews_df_copy
+_vader = None
+_pool = None
+_pool_processes = 0
+_pool_lock = Lock()
+
+
+def start_sentiment_worker() -> None:
+    """Builds this process's analyzer, loading the VADER lexicon once"""
+    global _vader  # pylint: disable=global-statement
+    _vader = SentimentIntensityAnalyzer()
+
+
+def score_reviews(reviews: list[str]) -> array:
+    """Returns the VADER compound score of each review as packed doubles"""
+    if _vader is None:
+        start_sentiment_worker()
+    return array("d", (_vader.polarity_scores(review)["compound"] for review in reviews))
+
+
+def get_sentiment_pool(processes: int) -> Pool:
+    """Returns the shared pool of scoring workers, started on first use"""
+    global _pool, _pool_processes  # pylint: disable=global-statement
+    with _pool_lock:
+        if _pool is None or _pool_processes != processes:
+            close_sentiment_pool()
+            _pool = get_context("fork").Pool(processes, initializer=start_sentiment_worker)
+            _pool_processes = processes
+        return _pool
+
+
+@atexit.register
+def close_sentiment_pool() -> None:
+    """Stops the scoring workers, if they were started"""
+    global _pool  # pylint: disable=global-statement
+    if _pool is not None:
+        _pool.close()
+        _pool.join()
+        _pool = None
+
+
+def get_compound_scores(reviews: list[str], processes: int = SENTIMENT_PROCESSES,
+                        batch_size: int = SENTIMENT_BATCH_SIZE) -> np.ndarray:
+    """Returns the compound score of each review, in order. Batches are scored
+    across worker processes unless there is only one batch, one process, or
+    this is already a daemonic worker, which cannot start its own pool"""
+    if processes <= 1 or len(reviews) <= batch_size or current_process().daemon:
+        return np.frombuffer(score_reviews(reviews), dtype=np.float64)
+    batches = [reviews[start:start + batch_size]
+               for start in range(0, len(reviews), batch_size)]
+    scores = array("d")
+    for batch_scores in get_sentiment_pool(processes).imap(score_reviews, batches):
+        scores.extend(batch_scores)
+    return np.frombuffer(scores, dtype=np.float64)
+
+
+class VaderScorer(SentimentScorer):
+    """NLTK's VADER, one review at a time across worker processes. The
+    reference the other scorers are checked against"""
+
+    name = "vader"
+
+    def __init__(self, processes: int = SENTIMENT_PROCESSES,
+                 batch_size: int = SENTIMENT_BATCH_SIZE):
+        self.processes = processes
+        self.batch_size = batch_size
+
+    @property
+    def version(self) -> str:
+        return f"nltk-{nltk.__version__}-{get_lexicon_digest()}"
+
+    def score(self, texts: list[str]) -> np.ndarray:
+        return get_compound_scores(texts, self.processes, self.batch_size)
+
+
+SCORERS = {scorer.name: scorer for scorer in [VaderScorer, LexiconScorer]}
+
+
+@cache
+def get_scorer(name: str = SENTIMENT_SCORER) -> SentimentScorer:
+    """Returns the scorer called name, built once per process"""
+    if name not in SCORERS:
+        raise ValueError(f"Unknown sentiment scorer {name}, choose from {', '.join(SCORERS)}")
+    return SCORERS[name]()
+
+
+def open_sentiment_cache(scorer: SentimentScorer | None = None) -> SentimentCache | None:
+    """Returns this process's sentiment cache for the scorer in use,
+    None if caching is turned off"""
+    scorer = scorer or get_scorer()
+    return get_sentiment_cache(scorer.version, scorer.name)
+
+
+def get_cached_compound_scores(reviews: list[str], sentiment_cache: SentimentCache,
+                               scorer: SentimentScorer) -> np.ndarray:
+    """Returns the compound score of each review, in order, only scoring
+    text not already in the cache, and each distinct text once"""
+    keys = [sentiment_cache.make_key(review) for review in reviews]
+    scores = sentiment_cache.get_many(keys)
+    unscored = {key: review for key, review in zip(keys, reviews) if key not in scores}
+    if unscored:
+        new_scores = dict(zip(unscored, scorer.score(list(unscored.values())).tolist()))
+        sentiment_cache.put_many(new_scores)
+        scores.update(new_scores)
+    return np.fromiter((scores[key] for key in keys), dtype=np.float64, count=len(keys))
+
+
+def rescale_compound_scores(compound_scores: np.ndarray) -> np.ndarray:
+    """Returns compound scores from -1 to 1 as ratings from 0 to 5, rounded
+    half up to one decimal place. VADER gives compound scores to four decimal
+    places, so working in ten-thousandths keeps the rounding exact"""
+    return ((np.rint(compound_scores * 10_000).astype(np.int64) + 10_000) * 25
+            + 5_000) // 10_000 / 10
+
+
+def get_sentiment_values(reviews_df: DataFrame, scorer: SentimentScorer | None = None,
+                         sentiment_cache: SentimentCache | None = None) -> DataFrame:
+    """Returns a data-frame with sentiment scores for each review from scorer,
+    SENTIMENT_SCORER by default, looking scores up in sentiment_cache first
+    if one is given"""
+    scorer = scorer or get_scorer()
+    reviews = reviews_df["clean_review"].tolist()
+    if sentiment_cache is None:
+        compound_scores = scorer.score(reviews)
+    else:
+        compound_scores = get_cached_compound_scores(reviews, sentiment_cache, scorer)
+    reviews_df["sentiment"] = rescale_compound_scores(compound_scores)
+    reviews_df.drop(columns=["clean_review"], inplace=True)
+    return reviews_df
@@ -0,0 +1,138 @@
+"""Cache of sentiment scores so repeated and re-extracted review text skips scoring"""
+from collections import OrderedDict
+from hashlib import blake2b
+from os import environ, getpid
+from pathlib import Path
+import sqlite3
+from time import time
+
+
+CACHE_DIRECTORY = environ.get("SENTIMENT_CACHE_DIR", ".sentiment_cache")
+CACHE_MEMORY_SIZE = int(environ.get("SENTIMENT_CACHE_MEMORY_SIZE", 100_000))
+CACHE_MAX_ROWS = int(environ.get("SENTIMENT_CACHE_MAX_ROWS", 5_000_000))
+
+# SQLite limits how many values one statement can take
+LOOKUP_BATCH_SIZE = 900
+
+
+class SentimentCache:
+    """Compound scores keyed by a BLAKE2b hash of the lexicon version and the
+    cleaned review text, held in an in-memory LRU in front of a SQLite store.
+    Each scorer keeps its scores in its own directory, one file per version.
+    Files from the scorer's other versions are removed when the store is
+    opened, leaving other scorers' files alone, and the least recently used
+    scores are evicted past max_rows.
+    Hits from memory and from disk, and misses, are counted"""
+
+    def __init__(self, lexicon_version: str, directory: str = CACHE_DIRECTORY,
+                 memory_size: int = CACHE_MEMORY_SIZE, max_rows: int = CACHE_MAX_ROWS,
+                 scorer_name: str = "default"):
+        scorer_directory = Path(directory) / scorer_name
+        scorer_directory.mkdir(parents=True, exist_ok=True)
+        for path in scorer_directory.glob("*.sqlite3*"):
+            if not path.name.startswith(f"{lexicon_version}.sqlite3"):
+                path.unlink(missing_ok=True)
+        self.lexicon_version = lexicon_version
+        self.scorer_name = scorer_name
+        self.memory_size = memory_size
+        self.max_rows = max_rows
+        self.memory_hits = self.disk_hits = self.misses = 0
+        self._memory = OrderedDict()
+        self._hasher = blake2b(lexicon_version.encode() + b"\0", digest_size=16)
+        self._conn = sqlite3.connect(scorer_directory / f"{lexicon_version}.sqlite3",
+                                     isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS sentiment (
+            key BLOB PRIMARY KEY, compound REAL NOT NULL, used_at REAL NOT NULL)""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sentiment_used_at ON sentiment (used_at)")
+
+    def make_key(self, text: str) -> bytes:
+        """Returns the key a cleaned review's score is kept under"""
+        hasher = self._hasher.copy()
+        hasher.update(text.encode())
+        return hasher.digest()
+
+    def remember(self, key: bytes, compound: float) -> None:
+        """Keeps a score in memory, forgetting the least recently used past memory_size"""
+        self._memory[key] = compound
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def get_many(self, keys: list[bytes]) -> dict[bytes, float]:
+        """Returns the scores held for any of the keys, from memory then disk.
+        Every key looked up is counted, and repeats of a key in the same call
+        count as memory hits, as they are served by the first one's score"""
+        found = {}
+        missing = []
+        distinct_keys = dict.fromkeys(keys)
+        for key in distinct_keys:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                found[key] = self._memory[key]
+            else:
+                missing.append(key)
+        self.memory_hits += len(found) + len(keys) - len(distinct_keys)
+
+        from_disk = []
+        for start in range(0, len(missing), LOOKUP_BATCH_SIZE):
+            batch = missing[start:start + LOOKUP_BATCH_SIZE]
+            from_disk.extend(self._conn.execute(
+                f"SELECT key, compound FROM sentiment WHERE key IN ({','.join('?' * len(batch))})",
+                batch).fetchall())
+        if from_disk:
+            now = time()
+            self._conn.executemany("UPDATE sentiment SET used_at = ? WHERE key = ?",
+                                   [(now, key) for key, _ in from_disk])
+        for key, compound in from_disk:
+            found[key] = compound
+            self.remember(key, compound)
+        self.disk_hits += len(from_disk)
+        self.misses += len(missing) - len(from_disk)
+        return found
+
+    def put_many(self, scores: dict[bytes, float]) -> None:
+        """Records newly worked out scores then evicts old ones if over max_rows"""
+        now = time()
+        self._conn.execute("BEGIN")
+        self._conn.executemany("INSERT OR REPLACE INTO sentiment VALUES (?, ?, ?)",
+                               [(key, compound, now) for key, compound in scores.items()])
+        self._conn.execute("COMMIT")
+        for key, compound in scores.items():
+            self.remember(key, compound)
+        self.evict()
+
+    def evict(self) -> None:
+        """Removes the least recently used scores until at most max_rows are stored"""
+        rows = self._conn.execute("SELECT COUNT(*) FROM sentiment").fetchone()[0]
+        if rows > self.max_rows:
+            self._conn.execute("""DELETE FROM sentiment WHERE key IN (
+                SELECT key FROM sentiment ORDER BY used_at LIMIT ?)""", (rows - self.max_rows,))
+
+    def stats(self) -> dict[str, int | float]:
+        """Returns the hit and miss counts so far and the share of lookups that hit"""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {"memory_hits": self.memory_hits, "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0}
+
+
+_sentiment_cache = None
+_sentiment_cache_pid = None
+
+
+def get_sentiment_cache(lexicon_version: str,
+                        scorer_name: str = "default") -> SentimentCache | None:
+    """Returns the cache shared by this process, opening it on first use
+    and again if the scorer or its version changes.
+    Forked workers open their own, as SQLite connections cannot cross a fork.
+    Returns None if SENTIMENT_CACHE_DIR is set empty to turn caching off"""
+    global _sentiment_cache, _sentiment_cache_pid  # pylint: disable=global-statement
+    if not CACHE_DIRECTORY:
+        return None
+    if (_sentiment_cache is None or _sentiment_cache_pid != getpid()
+            or _sentiment_cache.lexicon_version != lexicon_version
+            or _sentiment_cache.scorer_name != scorer_name):
+        _sentiment_cache = SentimentCache(lexicon_version, scorer_name=scorer_name)
+        _sentiment_cache_pid = getpid()
+    return _sentiment_cache
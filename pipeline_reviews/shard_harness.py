@@ -0,0 +1,100 @@
+"""Checks sharded runs of the review pipeline load the same reviews as one
+unsharded run. The pipeline is run against a local fake Steam server and the
+test database given by the DATABASE_* environment variables, once on its own
+and then as N shards side by side. Only use a disposable test database:
+the review table is emptied between runs"""
+
+from argparse import ArgumentParser
+from os import environ
+import subprocess
+import sys
+
+from psycopg2.extensions import connection
+
+from extract import get_db_connection
+from fake_steam import FakeSteam, run_fake_steam_server
+
+
+FIRST_SEEDED_APP_ID = 900000000
+
+
+def seed_games(conn: connection, games: int) -> None:
+    """Adds games released a week ago, inside the two weeks the pipeline
+    picks games from, and long enough ago for their reviews' playtimes
+    to fit in the time since release, or the reviews would be dropped"""
+    with conn.cursor() as cur:
+        for app_id in range(FIRST_SEEDED_APP_ID, FIRST_SEEDED_APP_ID + games):
+            cur.execute("""INSERT INTO game (app_id, title, release_date, price, sale_price,
+                platform_id) VALUES (%s, %s, NOW() - INTERVAL '7 days', 0, 0, 1)
+                ON CONFLICT DO NOTHING""",
+                        (app_id, f"Shard harness game {app_id}"))
+    conn.commit()
+
+
+def remove_seeded_games(conn: connection, games: int) -> None:
+    """Removes the seeded games and their reviews"""
+    with conn.cursor() as cur:
+        cur.execute("""DELETE FROM review WHERE game_id IN (SELECT game_id FROM game
+            WHERE app_id BETWEEN %s AND %s)""", (FIRST_SEEDED_APP_ID, FIRST_SEEDED_APP_ID + games))
+        cur.execute("DELETE FROM game WHERE app_id BETWEEN %s AND %s",
+                    (FIRST_SEEDED_APP_ID, FIRST_SEEDED_APP_ID + games))
+    conn.commit()
+
+
+def take_loaded_reviews(conn: connection) -> set[tuple]:
+    """Returns every review in the database, then empties the review table"""
+    with conn.cursor() as cur:
+        cur.execute("""SELECT game_id, review_text, review_score, reviewed_at,
+            playtime_last_2_weeks, sentiment FROM review""")
+        reviews = {tuple(review.values()) for review in cur.fetchall()}
+        cur.execute("DELETE FROM review")
+    conn.commit()
+    return reviews
+
+
+def run_pipelines(shards: list[str | None], base_url: str, chunk_size: int) -> None:
+    """Runs one pipeline process per shard at the same time, None running unsharded"""
+    env = dict(environ, STEAM_STORE_URL=base_url)
+    processes = []
+    for shard in shards:
+        command = [sys.executable, "pipeline.py", "--chunk-size", str(chunk_size)]
+        if shard:
+            command += ["--shard", shard]
+        processes.append(subprocess.Popen(command, env=env))
+    if any(process.wait() for process in processes):
+        raise SystemExit("A pipeline run failed.")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--games", type=int, default=40,
+                        help="games released a week ago to add to the test database")
+    parser.add_argument("--reviews-per-game", type=int, default=300)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    db_connection = get_db_connection()
+    seed_games(db_connection, args.games)
+    try:
+        with run_fake_steam_server(FakeSteam(default_reviews=args.reviews_per_game)) as url:
+            take_loaded_reviews(db_connection)
+            run_pipelines([None], url, args.chunk_size)
+            single_node = take_loaded_reviews(db_connection)
+            run_pipelines([f"{shard}/{args.shards}" for shard in range(args.shards)],
+                          url, args.chunk_size)
+            sharded = take_loaded_reviews(db_connection)
+    finally:
+        remove_seeded_games(db_connection, args.games)
+        db_connection.close()
+
+    print(f"Single node: {len(single_node)} reviews, "
+          f"{args.shards} shards: {len(sharded)} reviews.")
+    if not single_node:
+        print("The single node run loaded no reviews, so there is nothing to compare.")
+        raise SystemExit(1)
+    if single_node != sharded:
+        print(f"Mismatch: {len(single_node - sharded)} reviews missing from the shards, "
+              f"{len(sharded - single_node)} only in the shards.")
+        raise SystemExit(1)
+    print("Sharded runs loaded the same reviews as the single node run.")
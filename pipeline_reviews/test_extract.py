@@ -1,14 +1,19 @@
 """File with unit tests for extract.py"""
 
+from asyncio import run
 from unittest.mock import MagicMock
 
 from pytest import raises
-from requests.exceptions import Timeout
 
-from conftest import mock_multiprocessing, mock_get_game_reviews
+from conftest import fake_coroutine, mock_get_game_reviews
 from extract import get_game_ids, GamesNotFound, get_db_connection
-from extract import get_all_reviews, get_reviews_for_game
-from extract import get_number_of_reviews, get_game_reviews
+from extract import get_all_reviews, get_reviews_for_game, create_session
+from extract import get_game_reviews
+from extract import iter_review_pages, iter_review_chunks, get_review_watermarks
+from extract import ReviewPager, MAX_ATTEMPTS, BACKOFF_MAX_SECONDS, MAX_CONNECTIONS
+from extract import jump_consistent_hash, select_shard
+from extract import ReviewBatch, fingerprint_review
+from fake_steam import FIRST_TIMESTAMP
 
 
 def test_get_game_ids_passes():
@@ -39,61 +44,254 @@ def test_get_db_connection(monkeypatch):
     assert get_db_connection() is None
 
 
-def test_get_number_of_reviews(monkeypatch):
-    """Verifies that get request is correctly finding the number of reviews"""
-    fake_response = MagicMock()
-    fake_response.json.return_value = {
-        "query_summary": {"total_reviews": "test"}}
-    monkeypatch.setattr("requests.get", lambda *args, **kwargs: fake_response)
-    assert get_number_of_reviews(0) == "test"
+def test_get_game_reviews_stops_at_total(fake_steam, fake_steam_url):
+    """Verifies that the total from the first page is used so no
+    separate count request or trailing empty page is requested"""
+    async def game_reviews():
+        async with create_session() as session:
+            return await get_game_reviews(session, 1, fake_steam_url)
+    pages = run(game_reviews())
+    assert [len(page) for page in pages] == [100, 100, 50]
+    assert fake_steam.requests[1] == 3
+
+
+def test_get_game_reviews_no_total(fake_steam, fake_steam_url):
+    """Verifies that a game with no reviews costs a single request"""
+    fake_steam.default_reviews = 0
+    async def game_reviews():
+        async with create_session() as session:
+            return await get_game_reviews(session, 1, fake_steam_url)
+    assert not run(game_reviews())
+    assert fake_steam.requests[1] == 1
 
 
 def test_get_game_reviews_errors(monkeypatch):
     """Verifies that if error is found, an empty list is returned"""
-    monkeypatch.setattr("extract.get_number_of_reviews", lambda *args: 1)
-    monkeypatch.setattr("extract.get_reviews_for_game", lambda *args: {"error": "test"})
-    assert not get_game_reviews(0)
+    monkeypatch.setattr("extract.get_reviews_for_game", fake_coroutine({"error": "test"}))
+    assert not run(get_game_reviews(None, 0))
 
 
 def test_get_game_reviews_no_reviews(monkeypatch):
     """Verifies that no data is returned from no reviews"""
-    monkeypatch.setattr("extract.get_number_of_reviews", lambda *args: 1)
-    monkeypatch.setattr("extract.get_reviews_for_game", lambda *args: {
-        "next_cursor": "test", "reviews": []})
-    assert not get_game_reviews(0)
+    monkeypatch.setattr("extract.get_reviews_for_game", fake_coroutine({
+        "next_cursor": "test", "reviews": ReviewBatch()}))
+    assert not run(get_game_reviews(None, 0))
 
 
 def test_get_game_reviews_one_review(monkeypatch):
     """Verifies that reviews are correctly formed from the extraction"""
-    monkeypatch.setattr("extract.get_number_of_reviews", lambda *args: 1)
-    monkeypatch.setattr("extract.get_reviews_for_game", lambda *args: {
-        "next_cursor": "test", "reviews": [{},{}]})
-    assert get_game_reviews(0) == [[{},{}]]
+    page = ReviewBatch([0, 0], ["a", "b"], [1, 2], [3, 4], [5, 6])
+    monkeypatch.setattr("extract.get_reviews_for_game", fake_coroutine({
+        "next_cursor": "test", "reviews": page}))
+    assert run(get_game_reviews(None, 0)) == [page]
 
 
-def test_get_reviews_for_game_raises_error(monkeypatch):
+def test_get_reviews_for_game_raises_error():
     """Verifies that the test correctly identifies timeout error"""
-    fake_response = MagicMock()
-    fake_response.json.side_effect = Timeout()
-    monkeypatch.setattr("requests.get", lambda *args, **kwargs: fake_response)
-    assert "error" in get_reviews_for_game(10, "").keys()
+    fake_session = MagicMock()
+    fake_session.get.side_effect = TimeoutError()
+    assert "error" in run(get_reviews_for_game(fake_session, 10, "")).keys()
 
 
-def test_get_reviews_for_game_basic(monkeypatch):
-    """Verifies that reviews from mocked API request are collected correctly"""
-    fake_response = MagicMock()
-    fake_response.json.return_value = {"cursor": "", "reviews":
-                                       [{"review": 1, "votes_up": 1, "timestamp_created": 1672531200,
-                                         "author": {"playtime_forever": 10}}]}
-    monkeypatch.setattr("requests.get", lambda *args, **kwargs: fake_response)
-    assert get_reviews_for_game(10, "") == {"next_cursor": "", "reviews": [
-        {"game_id": 10, "last_timestamp": "2023-01-01 00:00:00",
-         "playtime_last_2_weeks": 10, "review": 1, "review_score": 1}]}
+def test_get_reviews_for_game_basic(fake_steam_url):
+    """Verifies that reviews from the fake API are collected correctly"""
+    async def first_page():
+        async with create_session() as session:
+            return await get_reviews_for_game(session, 10, "*", fake_steam_url)
+    page = run(first_page())
+    assert page["next_cursor"] == "AoJ/100+="
+    assert len(page["reviews"]) == 100
+    assert page["reviews"].to_frame().iloc[0].to_dict() == {
+        "game_id": 10, "review": "Review 0 of game 10", "review_score": 0,
+        "last_timestamp": FIRST_TIMESTAMP, "playtime_last_2_weeks": 10,
+        "review_hash": fingerprint_review("Review 0 of game 10", FIRST_TIMESTAMP)}
 
 
 def test_get_all_reviews(monkeypatch):
-    """Verifies that values from multiprocessing are correctly unpacked"""
-    monkeypatch.setattr("multiprocessing.Pool", mock_multiprocessing)
+    """Verifies that values from the crawl are correctly unpacked"""
     monkeypatch.setattr("extract.get_game_reviews", mock_get_game_reviews)
     returned_df = get_all_reviews([1])
-    assert returned_df.values == "test"
+    assert returned_df["review"].tolist() == ["test"]
+    assert returned_df["last_timestamp"].dtype == "int64"
+
+
+def test_get_all_reviews_from_fake_steam(fake_steam, fake_steam_url):
+    """Verifies that every review of every game is collected
+    by following the cursors through the fake Steam server"""
+    returned_df = get_all_reviews([1, 2, 3], fake_steam_url)
+    assert len(returned_df) == 3 * 250
+    assert set(returned_df["game_id"]) == {1, 2, 3}
+    assert not returned_df.duplicated().any()
+    assert fake_steam.requests == {1: 3, 2: 3, 3: 3}
+
+
+def test_iter_review_chunks(fake_steam_url):
+    """Verifies that reviews are streamed in chunks no larger than asked for"""
+    chunks = list(iter_review_chunks([1, 2], 120, fake_steam_url))
+    assert [len(chunk) for chunk in chunks] == [120, 120, 120, 120, 20]
+    assert sum(chunk["game_id"].eq(1).sum() for chunk in chunks) == 250
+
+
+def test_iter_review_pages_stops_early(fake_steam, fake_steam_url):
+    """Verifies that closing the stream part way stops the crawl, including
+    the games still waiting for a connection"""
+    fake_steam.default_reviews = 10000
+    pages = iter_review_pages(list(range(1, 301)), fake_steam_url, buffered_pages=1)
+    assert len(next(pages)) == 100
+    pages.close()
+    assert fake_steam.requests[1] < 100
+    assert sum(fake_steam.requests.values()) < 3 * MAX_CONNECTIONS
+
+
+def test_get_all_reviews_incremental(fake_steam, fake_steam_url):
+    """Verifies that only reviews newer than the watermark are fetched,
+    paging stops once it is reached and the watermark moves up"""
+    watermarks = {1: FIRST_TIMESTAMP - 150 * 60}
+    returned_df = get_all_reviews([1], fake_steam_url, watermarks)
+    assert len(returned_df) == 150
+    assert fake_steam.requests[1] == 2
+    assert watermarks == {1: FIRST_TIMESTAMP}
+
+
+def test_get_all_reviews_incremental_new_game(fake_steam_url):
+    """Verifies that a game without a watermark is fully extracted
+    and gains one"""
+    watermarks = {}
+    assert len(get_all_reviews([1], fake_steam_url, watermarks)) == 250
+    assert watermarks == {1: FIRST_TIMESTAMP}
+
+
+def test_get_all_reviews_incremental_failed_page(monkeypatch, fake_steam, fake_steam_url):
+    """Verifies that a game whose crawl fails partway keeps its watermark,
+    so the reviews it missed are fetched on the next run"""
+    monkeypatch.setattr("extract.sleep", fake_coroutine(None))
+    fake_steam.failing_cursors = {"AoJ/100+="}
+    watermarks = {1: FIRST_TIMESTAMP - 250 * 60}
+    assert len(get_all_reviews([1], fake_steam_url, watermarks)) == 100
+    assert watermarks == {1: FIRST_TIMESTAMP - 250 * 60}
+
+
+def test_get_review_watermarks():
+    """Verifies that watermarks are returned keyed by app ID"""
+    fake_connection = MagicMock()
+    fake_cursor = fake_connection.cursor().__enter__()
+    fake_cursor.fetchall.return_value = [{"app_id": 1, "newest_timestamp": 5}]
+    assert get_review_watermarks(fake_connection, [1, 2]) == {1: 5}
+
+
+def collect_pages(pager: ReviewPager, base_url: str) -> list:
+    """Returns every page the pager yields against base_url"""
+    async def pages():
+        async with create_session() as session:
+            return [page async for page in pager.pages(session, base_url)]
+    return run(pages())
+
+
+def test_review_pager_retries_rate_limits(monkeypatch, fake_steam, fake_steam_url):
+    """Verifies that HTTP 429 responses are waited out and retried"""
+    delays = []
+    monkeypatch.setattr("extract.sleep", fake_coroutine(None))
+    monkeypatch.setattr(ReviewPager, "backoff_delay",
+                        lambda self, retry_after: delays.append(self.attempts))
+    fake_steam.rate_limited_requests = 2
+    pages = collect_pages(ReviewPager(1), fake_steam_url)
+    assert sum(len(page) for page in pages) == 250
+    assert delays == [0, 1]
+
+
+def test_review_pager_gives_up(monkeypatch):
+    """Verifies that retrying stops after the maximum number of attempts"""
+    monkeypatch.setattr("extract.sleep", fake_coroutine(None))
+    failed_request = MagicMock(return_value={"error": "test", "retry": True})
+    monkeypatch.setattr("extract.get_reviews_for_game",
+                        lambda *args: fake_coroutine(failed_request())())
+    pager = ReviewPager(1)
+    assert not collect_pages(pager, "")
+    assert pager.failed
+    assert failed_request.call_count == MAX_ATTEMPTS + 1
+
+
+def test_review_pager_detects_cycles(monkeypatch):
+    """Verifies that paging stops when a cursor comes round again"""
+    monkeypatch.setattr("extract.get_reviews_for_game", fake_coroutine({
+        "next_cursor": "test", "reviews": ReviewBatch([1], ["a"], [0], [0], [1])}))
+    assert [page.reviews for page in collect_pages(ReviewPager(1), "")] == [["a"]]
+
+
+def test_review_pager_resumes_from_state(fake_steam, fake_steam_url):
+    """Verifies that a pager rebuilt from saved state carries on
+    from the page after the last one handed out"""
+    async def first_page(pager):
+        async with create_session() as session:
+            async for page in pager.pages(session, fake_steam_url):
+                return page
+    pager = ReviewPager(1)
+    first = run(first_page(pager))
+    resumed = ReviewPager.from_state(pager.state())
+    rest = collect_pages(resumed, fake_steam_url)
+    assert [len(page) for page in [first] + rest] == [100, 100, 50]
+    assert resumed.finished and not resumed.failed
+
+
+def test_review_pager_backoff_delay():
+    """Verifies that backoff delays are capped and respect Retry-After"""
+    pager = ReviewPager(1)
+    pager.attempts = 20
+    assert 0 <= pager.backoff_delay() <= BACKOFF_MAX_SECONDS
+    pager.attempts = 0
+    assert pager.backoff_delay(5) == 5
+
+
+def test_select_shard_splits_games():
+    """Verifies that every game lands in exactly one shard, roughly evenly"""
+    game_ids = list(range(2400000, 2404000))
+    shards = [select_shard(game_ids, shard, 4) for shard in range(4)]
+    assert sorted(sum(shards, [])) == game_ids
+    assert all(900 < len(shard) < 1100 for shard in shards)
+
+
+def test_jump_consistent_hash_moves_few_games():
+    """Verifies that adding a shard only moves games into the new shard"""
+    for game_id in range(2400000, 2404000):
+        before, after = jump_consistent_hash(game_id, 4), jump_consistent_hash(game_id, 5)
+        assert after in (before, 4)
+
+
+def test_select_shard_empty():
+    """Verifies that a shard with no games raises GamesNotFound"""
+    with raises(GamesNotFound):
+        select_shard([1], 1 - jump_consistent_hash(1, 2), 2)
+
+
+def test_review_batch_from_api_keeps_newer_reviews():
+    """Verifies that only reviews after since are kept from an API response"""
+    raw_reviews = [{"review": "new", "votes_up": 1, "timestamp_created": 20,
+                    "author": {"playtime_forever": 5}},
+                   {"review": "old", "votes_up": 2, "timestamp_created": 10,
+                    "author": {"playtime_forever": 6}}]
+    batch = ReviewBatch.from_api(raw_reviews, 7, since=10)
+    assert batch.to_frame().to_dict("records") == [
+        {"game_id": 7, "review": "new", "review_score": 1,
+         "last_timestamp": 20, "playtime_last_2_weeks": 5,
+         "review_hash": fingerprint_review("new", 20)}]
+
+
+def test_review_batch_concat_and_take():
+    """Verifies that batches join in order and split back up by position"""
+    first = ReviewBatch([1, 1], ["a", "b"], [0, 1], [10, 11], [5, 6])
+    second = ReviewBatch([2], ["c"], [2], [12], [7])
+    combined = ReviewBatch.concat([first, second])
+    assert len(combined) == 3
+    assert combined.take(1).reviews == ["b", "c"]
+    assert list(combined.take(0, 2).timestamps) == [10, 11]
+    assert combined.to_frame()["game_id"].dtype == "int64"
+
+
+def test_fingerprint_review():
+    """Verifies that fingerprints are signed 64-bit ints telling reviews apart
+    by text and creation time"""
+    fingerprint = fingerprint_review("Great game", 100)
+    assert -2 ** 63 <= fingerprint < 2 ** 63
+    assert fingerprint == fingerprint_review("Great game", 100)
+    assert fingerprint != fingerprint_review("Great game", 101)
+    assert fingerprint != fingerprint_review("Great game!", 100)
@@ -0,0 +1,98 @@
+"""File with unit tests for job_queue.py"""
+
+from pandas import DataFrame
+from pytest import raises
+
+from extract import ReviewPager, iter_pager_pages
+from job_queue import JobQueue, SQLiteJobQueue
+import pipeline
+
+
+def make_queue(path, lease_seconds: float = 600, max_attempts: int = 3) -> SQLiteJobQueue:
+    """Returns a job queue in a SQLite file holding jobs for games 1 to 4"""
+    job_queue = SQLiteJobQueue(str(path / "jobs.sqlite3"), "run", lease_seconds, max_attempts)
+    job_queue.enqueue([ReviewPager(game_id).state() for game_id in range(1, 5)])
+    return job_queue
+
+
+def test_workers_claim_different_jobs(tmp_path):
+    """Verifies that jobs leased to one worker are not handed to another"""
+    job_queue = make_queue(tmp_path)
+    first = job_queue.claim("worker-1", 3)
+    second = job_queue.claim("worker-2", 3)
+    assert [state["game_id"] for state in first] == [1, 2, 3]
+    assert [state["game_id"] for state in second] == [4]
+    assert job_queue.claim("worker-3", 3) == []
+
+
+def test_enqueue_keeps_existing_jobs(tmp_path):
+    """Verifies that enqueueing again does not reset jobs already in the run"""
+    job_queue = make_queue(tmp_path)
+    job_queue.claim("worker-1", 4)
+    job_queue.enqueue([ReviewPager(1).state()])
+    assert job_queue.count_by_status() == {"running": 4}
+
+
+def test_expired_lease_resumes_from_saved_cursor(tmp_path):
+    """Verifies that a job whose worker died is claimed again at its saved cursor"""
+    job_queue = make_queue(tmp_path, lease_seconds=-1)
+    state = job_queue.claim("worker-1", 1)[0]
+    state["cursor"] = "AoJ/100+="
+    job_queue.save([state])
+    resumed = job_queue.claim("worker-2", 1)[0]
+    assert resumed["game_id"] == 1
+    assert resumed["cursor"] == "AoJ/100+="
+
+
+def test_failed_jobs_retried_until_out_of_attempts(tmp_path):
+    """Verifies that failed jobs go back to pending until their attempts run out"""
+    job_queue = make_queue(tmp_path, max_attempts=2)
+    for _ in range(2):
+        state = job_queue.claim("worker-1", 1)[0]
+        assert not state["failed"]
+        state["finished"] = state["failed"] = True
+        job_queue.save([state])
+    assert job_queue.count_by_status() == {"failed": 1, "pending": 3}
+
+
+def test_finished_jobs_not_claimed_again(tmp_path):
+    """Verifies that done jobs are never handed out again"""
+    job_queue = make_queue(tmp_path, lease_seconds=-1)
+    for state in job_queue.claim("worker-1", 4):
+        state["finished"] = True
+        job_queue.save([state])
+    assert job_queue.claim("worker-1", 4) == []
+    assert job_queue.count_by_status() == {"done": 4}
+
+
+def test_run_jobs_resumes_after_failed_commit(monkeypatch, tmp_path, fake_steam_url):
+    """Verifies that a restarted run loads only the pages not yet committed"""
+    job_queue = make_queue(tmp_path, lease_seconds=-1)
+    loaded = []
+    commits = iter([True, False])
+
+    def fake_load_chunk(conn, reviews: DataFrame) -> tuple[bool, int]:
+        committed = next(commits, True)
+        if committed:
+            loaded.extend(reviews["review"])
+        return committed, len(reviews)
+
+    monkeypatch.setattr("pipeline.iter_pager_pages",
+                        lambda pagers: iter_pager_pages(pagers, fake_steam_url))
+    monkeypatch.setattr("pipeline.load_chunk", fake_load_chunk)
+
+    assert not pipeline.run_jobs(None, job_queue, 200, worker_id="worker-1")
+    assert pipeline.run_jobs(None, job_queue, 200, worker_id="worker-2")
+
+    assert sorted(loaded) == sorted(f"Review {position} of game {game_id}"
+                                    for game_id in range(1, 5) for position in range(250))
+    assert job_queue.count_by_status() == {"done": 4}
+
+
+def test_job_queue_needs_execute():
+    """Verifies that a queue without a way to run SQL cannot be made"""
+    class IncompleteJobQueue(JobQueue):
+        """Job queue missing execute"""
+
+    with raises(TypeError):
+        IncompleteJobQueue(None, "run")
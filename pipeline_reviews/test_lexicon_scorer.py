@@ -0,0 +1,57 @@
+"""File with unit tests for lexicon_scorer.py"""
+
+from nltk.sentiment.vader import SentimentIntensityAnalyzer
+import pytest
+
+from lexicon_scorer import LexiconScorer, SentimentScorer, strip_punctuation
+
+
+LEXICON = "\n".join(f"{word}\t{valence}\t0.5\t[1, 1]" for word, valence in [
+    ("good", 1.9), ("bad", -2.5), ("great", 3.1), ("love", 3.2), ("hate", -2.7),
+    ("fun", 2.3), ("boring", -1.3), ("bomb", -2.2), (":)", 2.0), ("like", 2.0)])
+
+REVIEWS = ["great game, not bad!", "This is NOT good but I LOVE it",
+           "never so good", "at least fun", "least fun", "kind of good",
+           "good good GOOD bad", "", "a", "very very good??", "boring, I hated it!!!!",
+           "didn't like it", "sort of fun :)", "this game is the bomb",
+           "hardly boring but never this fun", "EXTREMELY good. really BAD"]
+
+
+@pytest.fixture
+def nltk_vader(monkeypatch) -> SentimentIntensityAnalyzer:
+    """NLTK's analyzer loaded with LEXICON rather than the installed lexicon"""
+    monkeypatch.setattr("nltk.data.load", lambda *args, **kwargs: LEXICON)
+    return SentimentIntensityAnalyzer()
+
+
+def test_strip_punctuation():
+    """Verifies that punctuation is split off one side of words only"""
+    assert [strip_punctuation(token) for token in "a good! (bad) ?!?fun :) can't".split()] == [
+        None, "good", "(bad)", "fun", ":)", "can't"]
+
+
+def test_lexicon_scorer_matches_nltk(nltk_vader):
+    """Verifies that every rule gives the same scores as NLTK's VADER"""
+    scores = LexiconScorer(LEXICON.encode()).score(REVIEWS)
+    assert scores.tolist() == [nltk_vader.polarity_scores(review)["compound"]
+                               for review in REVIEWS]
+
+
+def test_lexicon_scorer_empty_batch():
+    """Verifies that an empty batch gives an empty float array"""
+    assert LexiconScorer(LEXICON.encode()).score([]).dtype == "float64"
+
+
+def test_lexicon_scorer_version():
+    """Verifies that the version changes with the lexicon"""
+    assert LexiconScorer(b"good\t1.9").version != LexiconScorer(b"good\t2.0").version
+
+
+def test_sentiment_scorer_needs_score():
+    """Verifies that a scorer without a way to score cannot be made"""
+    class IncompleteScorer(SentimentScorer):
+        """Scorer missing score"""
+        version = "incomplete"
+
+    with pytest.raises(TypeError):
+        IncompleteScorer()
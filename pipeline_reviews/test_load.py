@@ -1,8 +1,13 @@
 """File with unit tests for load.py"""
 
+from datetime import date
+from hashlib import md5
 from unittest.mock import MagicMock
 
+from pandas import DataFrame
+
 from load import get_game_ids_foreign_key_values, get_game_ids, move_reviews_to_db
+from load import update_review_watermarks, remove_stored_reviews
 
 
 def test_get_game_ids_foreign_key_values(monkeypatch, fake_df_load):
@@ -33,3 +38,53 @@ def test_move_reviews_to_db(monkeypatch, fake_df_load, capfd):
     move_reviews_to_db(fake_connection, fake_df_load)
     captured = capfd.readouterr()
     assert "Data committed!" in captured.out
+
+
+def test_move_reviews_to_db_keeps_connection_open(monkeypatch, fake_df_load):
+    """Verifies that the connection is committed but not closed
+    so following chunks can be loaded over it"""
+    fake_connection = MagicMock()
+    monkeypatch.setattr("load.execute_batch", lambda *args: None)
+    move_reviews_to_db(fake_connection, fake_df_load)
+    assert fake_connection.commit.called
+    assert not fake_connection.close.called
+
+
+def test_update_review_watermarks(monkeypatch):
+    """Verifies that a watermark row is written per game and committed"""
+    fake_connection = MagicMock()
+    fake_batch = MagicMock()
+    monkeypatch.setattr("load.execute_batch", fake_batch)
+    update_review_watermarks(fake_connection, {1: 5, 2: 6})
+    assert fake_batch.call_args[0][2] == [(1, 5), (2, 6)]
+    assert fake_connection.commit.called
+
+
+def test_remove_stored_reviews():
+    """Verifies that reviews already stored for their game are dropped
+    and the rest kept"""
+    fake_connection = MagicMock()
+    fake_cursor = fake_connection.cursor().__enter__()
+    fake_cursor.fetchall.return_value = [{"app_id": 1, "review_hash": 10,
+                                          "text_digest": md5(b"good").hexdigest(),
+                                          "reviewed_at": date(2024, 1, 1)}]
+    fake_df = DataFrame({"game_id": [1, 1, 2], "review": ["good", "bad", "good"],
+                         "last_timestamp": [date(2024, 1, 1)] * 3, "review_hash": [10, 11, 10]})
+    returned_df = remove_stored_reviews(fake_connection, fake_df)
+    assert returned_df[["game_id", "review_hash"]].values.tolist() == [[1, 11], [2, 10]]
+
+
+def test_remove_stored_reviews_without_fingerprints():
+    """Verifies that reviews stored before fingerprints were added
+    are matched by game, text and date"""
+    fake_connection = MagicMock()
+    fake_cursor = fake_connection.cursor().__enter__()
+    fake_cursor.fetchall.return_value = [{"app_id": 1, "review_hash": None,
+                                          "text_digest": md5(b"10/10").hexdigest(),
+                                          "reviewed_at": date(2024, 1, 1)}]
+    fake_df = DataFrame({"game_id": [1, 1, 2, 1], "review": ["10/10", "10/10", "10/10", "good"],
+                         "last_timestamp": [date(2024, 1, 1), date(2024, 1, 2),
+                                            date(2024, 1, 1), date(2024, 1, 1)],
+                         "review_hash": [10, 11, 12, 13]})
+    returned_df = remove_stored_reviews(fake_connection, fake_df)
+    assert returned_df["review_hash"].tolist() == [11, 12, 13]
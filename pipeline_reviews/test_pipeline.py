@@ -0,0 +1,52 @@
+"""File with unit tests for pipeline.py"""
+
+from unittest.mock import MagicMock
+
+from extract import iter_review_chunks
+import pipeline
+
+
+def test_run_processes_loads_every_game(monkeypatch, capsys, fake_steam_url):
+    """Verifies that worker processes load every game's reviews and
+    send back a summary of each game"""
+    monkeypatch.setattr("pipeline.get_db_connection", lambda: None)
+    monkeypatch.setattr("pipeline.load_chunk", lambda conn, reviews: (True, len(reviews)))
+    monkeypatch.setattr("pipeline.iter_review_chunks", lambda game_ids, chunk_size, watermarks:
+                        iter_review_chunks(game_ids, chunk_size, fake_steam_url, watermarks))
+
+    assert pipeline.run_processes([1, 2, 3], 2, 100)
+
+    summaries = [line for line in capsys.readouterr().out.splitlines()
+                 if line.startswith("Game") and "loaded" in line]
+    assert sorted(summary.split(":")[0] for summary in summaries) == [
+        "Game 1", "Game 2", "Game 3"]
+    assert all("loaded 250 reviews" in summary for summary in summaries)
+
+
+def test_run_batch_uses_given_connection(monkeypatch):
+    """Verifies that every step of the batch path is handed the
+    pipeline's connection and the loaded reviews are committed"""
+    fake_connection = MagicMock()
+    steps = MagicMock()
+    for step in ["transform_reviews", "remove_stored_reviews",
+                 "get_game_ids_foreign_key_values", "move_reviews_to_db"]:
+        monkeypatch.setattr(f"pipeline.{step}", getattr(steps, step))
+    monkeypatch.setattr("pipeline.get_all_reviews", lambda game_ids, watermarks: "reviews")
+    monkeypatch.setattr("pipeline.isolate_non_stop_words", lambda reviews: reviews)
+    monkeypatch.setattr("pipeline.get_sentiment_values", lambda reviews, sentiment_cache: reviews)
+    monkeypatch.setattr("pipeline.open_sentiment_cache", lambda: None)
+    monkeypatch.setattr("pipeline.remove_unnamed", lambda reviews: reviews)
+    steps.move_reviews_to_db.return_value = True
+
+    assert pipeline.run_batch(fake_connection, [1])
+    steps.transform_reviews.assert_called_once_with("reviews", fake_connection)
+    for step in [steps.remove_stored_reviews, steps.get_game_ids_foreign_key_values,
+                 steps.move_reviews_to_db]:
+        assert step.call_args.args[0] is fake_connection
+
+
+def test_load_chunk_every_review_dropped(fake_df_transform):
+    """Verifies that a chunk left empty by the transform loads nothing and counts as committed"""
+    fake_df_transform["playtime_last_2_weeks"] = [0, 0]
+    fake_df_transform["review_hash"] = [1, 2]
+    assert pipeline.load_chunk(MagicMock(), fake_df_transform) == (True, 0)
@@ -0,0 +1,64 @@
+"""File with unit tests for rate_limiter.py"""
+
+from asyncio import run
+from multiprocessing import get_context
+from time import monotonic
+
+from rate_limiter import TokenBucket, get_endpoint_family, wait_for_token_async
+
+
+def take_token(bucket: TokenBucket) -> float:
+    """Reserves a token from a bucket inherited by a forked process"""
+    return bucket.reserve()
+
+
+def test_token_bucket_allows_burst():
+    """Verifies that tokens up to the capacity are available at once"""
+    bucket = TokenBucket(rate=1, capacity=3)
+    assert [bucket.reserve() for _ in range(3)] == [0, 0, 0]
+
+
+def test_token_bucket_spaces_out_requests():
+    """Verifies that requests past the burst wait their turn at the rate"""
+    bucket = TokenBucket(rate=10, capacity=1)
+    bucket.reserve()
+    assert 0.09 < bucket.reserve() <= 0.1
+    assert 0.19 < bucket.reserve() <= 0.2
+
+
+def test_token_bucket_acquire_async():
+    """Verifies that coroutines are made to wait for tokens"""
+    bucket = TokenBucket(rate=20, capacity=1)
+    time_started = monotonic()
+    run(bucket.acquire_async())
+    run(bucket.acquire_async())
+    assert monotonic() - time_started >= 0.04
+
+
+def test_token_bucket_shared_between_processes():
+    """Verifies that forked processes draw from the same bucket"""
+    bucket = TokenBucket(rate=1, capacity=2)
+    context = get_context("fork")
+    for _ in range(2):
+        process = context.Process(target=take_token, args=(bucket,))
+        process.start()
+        process.join()
+    assert bucket.reserve() > 0.9
+
+
+def test_get_endpoint_family():
+    """Verifies that urls are grouped into the right family of endpoints"""
+    assert get_endpoint_family(
+        "https://store.steampowered.com/appreviews/10?json=1") == "appreviews"
+    assert get_endpoint_family(
+        "https://store.steampowered.com/api/appdetails?appids=10") == "appdetails"
+    assert get_endpoint_family("https://store.steampowered.com/app/10") == "store_page"
+    assert get_endpoint_family("http://127.0.0.1:8080/appreviews/10") is None
+
+
+def test_wait_for_token_async_ignores_other_hosts():
+    """Verifies that requests not going to Steam are never limited"""
+    time_started = monotonic()
+    for _ in range(100):
+        run(wait_for_token_async("http://127.0.0.1/appreviews/10"))
+    assert monotonic() - time_started < 1
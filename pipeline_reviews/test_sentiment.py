@@ -2,13 +2,28 @@
 
 from unittest.mock import MagicMock
 
+import numpy as np
+from pytest import raises
+
 from sentiment import remove_stopwords, isolate_non_stop_words, get_sentiment_values
+from sentiment import make_cleaning_table, get_compound_scores, rescale_compound_scores
+from sentiment import close_sentiment_pool, get_cached_compound_scores
+from sentiment import VaderScorer, get_scorer
+from sentiment_cache import SentimentCache
 
 
 def test_remove_stopwords(fake_review):
     """Verifies that the function correctly removes punctuation
     and stop words provided"""
-    assert remove_stopwords(fake_review, ["fail"], [";", ","]) == "Test review"
+    assert remove_stopwords(fake_review, frozenset(["fail"]),
+                            make_cleaning_table(";,")) == "Test review"
+
+
+def test_remove_stopwords_keeps_spacing_and_case():
+    """Verifies that stop words are matched whatever their case, and
+    that runs of spaces and digits inside words are kept as before"""
+    review = "The  GAME is\n2good, isn't it?"
+    assert remove_stopwords(review, frozenset(["the", "is", "it?"])) == " GAME good isnt"
 
 
 def test_isolate_non_stop_words(monkeypatch, fake_df_sentiment):
@@ -27,5 +42,52 @@ def test_get_sentiment_values(fake_df_sentiment, monkeypatch):
     fake_sentiment_analyser.polarity_scores.return_value = {"compound": 0}
     monkeypatch.setattr("sentiment.SentimentIntensityAnalyzer",
                 lambda *args: fake_sentiment_analyser)
-    returned_df = get_sentiment_values(fake_df_sentiment)
+    monkeypatch.setattr("sentiment._vader", None)
+    returned_df = get_sentiment_values(fake_df_sentiment, VaderScorer())
     assert returned_df["sentiment"].values[0] == 2.5
+
+
+def test_get_scorer_unknown():
+    """Verifies that asking for a scorer that does not exist raises ValueError"""
+    with raises(ValueError):
+        get_scorer("unknown")
+
+
+class FakeAnalyzer:
+    """Scores a review by its length, so results show their order"""
+
+    def polarity_scores(self, review: str) -> dict:
+        return {"compound": len(review) / 100}
+
+
+def test_get_compound_scores_across_processes(monkeypatch):
+    """Verifies that scores from the worker pool come back in review order"""
+    monkeypatch.setattr("sentiment.SentimentIntensityAnalyzer", FakeAnalyzer)
+    monkeypatch.setattr("sentiment._vader", None)
+    reviews = ["a" * length for length in range(7)]
+    try:
+        scores = get_compound_scores(reviews, processes=2, batch_size=2)
+    finally:
+        close_sentiment_pool()
+    assert scores.tolist() == [length / 100 for length in range(7)]
+
+
+def test_rescale_compound_scores():
+    """Verifies that compound scores become ratings out of 5, rounding
+    halves up even where the float sits just below them"""
+    scores = rescale_compound_scores(np.array([-1, 0, 1, 0.5, -0.74, -0.62]))
+    assert scores.tolist() == [0, 2.5, 5, 3.8, 0.7, 1.0]
+
+
+def test_get_cached_compound_scores(tmp_path):
+    """Verifies that only text missing from the cache is scored, once each"""
+    scored = []
+    fake_scorer = MagicMock()
+    fake_scorer.score = lambda reviews: scored.extend(reviews) or np.array(
+        [len(review) / 100 for review in reviews])
+    cache = SentimentCache("v1", str(tmp_path))
+    cache.put_many({cache.make_key("good game"): 0.44})
+    scores = get_cached_compound_scores(["10/10", "good game", "10/10"], cache, fake_scorer)
+    assert scores.tolist() == [0.05, 0.44, 0.05]
+    assert scored == ["10/10"]
+    assert cache.stats()["hit_rate"] == 2 / 3
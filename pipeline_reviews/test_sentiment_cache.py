@@ -0,0 +1,69 @@
+"""File with unit tests for sentiment_cache.py"""
+
+from sentiment_cache import SentimentCache
+
+
+def test_scores_kept_on_disk(tmp_path):
+    """Verifies that scores stored by one cache are found by the next"""
+    cache = SentimentCache("v1", str(tmp_path))
+    key = cache.make_key("good game")
+    cache.put_many({key: 0.44})
+    reopened = SentimentCache("v1", str(tmp_path))
+    assert reopened.get_many([key, reopened.make_key("bad game")]) == {key: 0.44}
+    assert reopened.stats() == {"memory_hits": 0, "disk_hits": 1, "misses": 1,
+                                "hit_rate": 0.5}
+
+
+def test_memory_hits_counted(tmp_path):
+    """Verifies that stored scores are then served from memory"""
+    cache = SentimentCache("v1", str(tmp_path))
+    key = cache.make_key("10/10")
+    cache.put_many({key: 0.0})
+    assert cache.get_many([key, key]) == {key: 0.0}
+    assert cache.stats()["memory_hits"] == 2
+
+
+def test_keys_depend_on_lexicon_version(tmp_path):
+    """Verifies that scores from another lexicon version are never used"""
+    cache = SentimentCache("v1", str(tmp_path))
+    key = cache.make_key("good game")
+    cache.put_many({key: 0.44})
+    newer = SentimentCache("v2", str(tmp_path))
+    assert newer.make_key("good game") != key
+    assert not newer.get_many([key])
+
+
+def test_least_recently_used_evicted(tmp_path):
+    """Verifies that memory and disk keep only the most recently used scores"""
+    cache = SentimentCache("v1", str(tmp_path), memory_size=1, max_rows=2)
+    first, second, third = (cache.make_key(text) for text in ["a", "b", "c"])
+    cache.put_many({first: 0.1})
+    cache.put_many({second: 0.2})
+    cache.put_many({third: 0.3})
+    assert cache.get_many([first, second, third]) == {second: 0.2, third: 0.3}
+    assert cache.stats()["memory_hits"] == 1
+
+
+def test_repeated_keys_counted_as_hits(tmp_path):
+    """Verifies that a key repeated in one lookup counts a miss then hits"""
+    cache = SentimentCache("v1", str(tmp_path))
+    key = cache.make_key("10/10")
+    assert not cache.get_many([key, key, key])
+    assert cache.stats() == {"memory_hits": 2, "disk_hits": 0, "misses": 1,
+                             "hit_rate": 2 / 3}
+
+
+def test_scorers_keep_their_own_scores(tmp_path):
+    """Verifies that opening the cache for one scorer keeps the other scorer's
+    scores, while its own older versions are removed"""
+    vader = SentimentCache("nltk-v1", str(tmp_path), scorer_name="vader")
+    vader.put_many({vader.make_key("good game"): 0.44})
+    lexicon = SentimentCache("lexicon-v1", str(tmp_path), scorer_name="lexicon")
+    lexicon.put_many({lexicon.make_key("good game"): 0.45})
+    SentimentCache("lexicon-v2", str(tmp_path), scorer_name="lexicon")
+
+    reopened = SentimentCache("nltk-v1", str(tmp_path), scorer_name="vader")
+    assert reopened.get_many([reopened.make_key("good game")]) == {
+        reopened.make_key("good game"): 0.44}
+    assert [path.name for path in (tmp_path / "lexicon").glob("*.sqlite3")] == [
+        "lexicon-v2.sqlite3"]
@@ -2,20 +2,24 @@
 
 from datetime import date
 from unittest.mock import MagicMock
-from pandas import DataFrame
+from pandas import DataFrame, Series, Timedelta, Timestamp
 from numpy import int64
 
-from transform import get_release_date, remove_empty_rows, validate_time_string
+from transform import get_release_dates, remove_empty_rows
 from transform import remove_duplicate_reviews, remove_unnamed, correct_cell_values
-from transform import change_column_types, correct_playtime
+from transform import change_column_types, correct_playtime, transform_reviews
+from extract import ReviewBatch
 
 
-def test_get_release_date():
-    """Verifies that release date returnes correct value"""
+def test_get_release_dates():
+    """Verifies that release dates of every game come back from one query"""
     fake_connection = MagicMock()
     fake_cursor = fake_connection.cursor().__enter__()
-    fake_fetch = fake_cursor.fetchone.return_value = {"release_date": 1}
-    assert get_release_date(0, fake_connection, {}) == 1
+    fake_cursor.fetchall.return_value = [{"app_id": 1, "release_date": date(2023, 9, 1)},
+                                         {"app_id": 2, "release_date": date(2023, 9, 2)}]
+    release_dates = get_release_dates(fake_connection, [1, 2])
+    assert fake_cursor.execute.call_count == 1
+    assert release_dates[2] == Timestamp(2023, 9, 2)
 
 
 def test_remove_empty_rows():
@@ -24,22 +28,11 @@ def test_remove_empty_rows():
     assert remove_empty_rows(fake_df).empty
 
 
-def test_validate_time_string_basic(time_string):
-    """Verifies that correct object type
-    is returned (date) from a timestamp string"""
-    assert isinstance(validate_time_string(time_string), date)
-
-
-def test_validate_time_string_error():
-    """Verifies that when error occurs, None is returned"""
-    assert validate_time_string(None) is None
-
-
 def test_remove_duplicate_reviews():
-    """Verifies that duplicate rows are removed"""
-    fake_review = {"review": "test", "game_id": 1, "playtime_last_2_weeks": 55}
-    fake_df = DataFrame([fake_review, fake_review])
-    assert remove_duplicate_reviews(fake_df).shape == (1, 3)
+    """Verifies that rows with the same fingerprint for a game are removed"""
+    fake_review = {"review": "test", "game_id": 1, "review_hash": 55}
+    fake_df = DataFrame([fake_review, fake_review, {**fake_review, "game_id": 2}])
+    assert remove_duplicate_reviews(fake_df).shape == (2, 3)
 
 
 def test_remove_unnamed():
@@ -64,9 +57,48 @@ def test_change_column_types(fake_df_transform):
                returned_df["playtime_last_2_weeks"].values)
 
 
-def test_correct_playtime(monkeypatch, time_string, fake_df_transform):
+def test_change_column_types_dates(fake_df_transform):
+    """Verifies that unix timestamps become the date they fall on,
+    and missing timestamps become empty values"""
+    fake_df_transform.loc[1, "last_timestamp"] = None
+    returned_df = change_column_types(fake_df_transform)
+    assert returned_df.loc[0, "last_timestamp"] == date(2019, 2, 23)
+    assert returned_df["last_timestamp"].isna().tolist() == [False, True]
+
+
+def test_correct_playtime(monkeypatch, fake_df_transform):
     """Verifies that function correctly identifies that playtime is valid"""
-    monkeypatch.setattr("transform.get_db_connection", lambda *args: None)
-    monkeypatch.setattr("transform.get_release_date",
-                        lambda *args: validate_time_string(time_string))
-    assert correct_playtime(fake_df_transform).equals(fake_df_transform)
+    monkeypatch.setattr("transform.get_release_dates", lambda *args: Series(
+        [Timestamp(2019, 2, 23)] * 2, index=[1, 2]))
+    assert correct_playtime(fake_df_transform, None).equals(fake_df_transform)
+
+
+def test_correct_playtime_drops_impossible_playtimes(monkeypatch, fake_df_transform):
+    """Verifies that reviews with more playtime than minutes since release,
+    or for games with no release date, are removed"""
+    yesterday = Timestamp.now().normalize() - Timedelta(days=1)
+    monkeypatch.setattr("transform.get_release_dates", lambda *args: Series(
+        [yesterday], index=[1]))
+    fake_df_transform["playtime_last_2_weeks"] = [24 * 60, 24 * 60]
+    assert correct_playtime(fake_df_transform, None)["game_id"].tolist() == [1]
+
+
+def test_correct_playtime_no_release_dates(monkeypatch, fake_df_transform):
+    """Verifies that reviews are all removed when none of their games has a release date"""
+    monkeypatch.setattr("transform.get_release_dates", lambda *args: Series(
+        [], dtype="datetime64[s]"))
+    assert correct_playtime(fake_df_transform, None).empty
+
+
+def test_transform_reviews_empty_frame():
+    """Verifies that an empty batch of reviews is returned empty without a lookup"""
+    fake_connection = MagicMock()
+    assert transform_reviews(ReviewBatch().to_frame(), fake_connection).empty
+    assert not fake_connection.cursor.called
+
+
+def test_transform_reviews_every_row_dropped(fake_df_transform):
+    """Verifies that a batch whose rows are all invalid comes back empty"""
+    fake_df_transform["playtime_last_2_weeks"] = [0, 0]
+    fake_df_transform["review_hash"] = [1, 2]
+    assert transform_reviews(fake_df_transform, MagicMock()).empty
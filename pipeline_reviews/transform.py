@@ -1,47 +1,40 @@
 """Validates received review inputs"""
 
-from datetime import datetime, date
-
 import pandas as pd
-from pandas import DataFrame
+from pandas import DataFrame, Series
 from psycopg2 import Error
 from psycopg2.extensions import connection
 
-from extract import get_db_connection
-
 
-def get_release_date(game_id: int, conn: connection, cache: dict) -> date:
-    """Retrieves the release date for a game with a provided ID"""
-    if game_id in cache:
-        return cache[game_id]
+def get_release_dates(conn: connection, game_ids: list[int]) -> Series:
+    """Returns the release date of each game, indexed by app ID, in one query"""
     with conn.cursor() as cur:
-        cur.execute(
-            "SELECT release_date FROM game WHERE app_id = %s;", [game_id])
-        release_date = cur.fetchone()["release_date"]
-    cache[game_id] = release_date
-    return cache[game_id]
-
-
-def correct_playtime(reviews_df: DataFrame) -> DataFrame:
-    """Returns a data-frame with valid playtime recordings only"""
-    reviews_df_copy = reviews_df.copy()
-
+        cur.execute("SELECT app_id, release_date FROM game WHERE app_id = ANY(%s);",
+                    [game_ids])
+        release_dates = cur.fetchall()
+    return Series([row["release_date"] for row in release_dates],
+                  index=[row["app_id"] for row in release_dates], dtype="datetime64[s]")
+
+
+def correct_playtime(reviews_df: DataFrame, conn: connection) -> DataFrame:
+    """Returns a data-frame with valid playtime recordings only,
+    no more minutes than there have been since the game's release"""
+    if reviews_df.empty:
+        return reviews_df
     try:
-        release_date_cache = {}
-        conn = get_db_connection()
-        reviews_df_copy["release_date"] = reviews_df_copy["game_id"].apply(
-            lambda row: get_release_date(row, conn, release_date_cache))
-        time_now = datetime.now().date()
-        reviews_df_copy["maximum_playtime_since_release"] = reviews_df_copy["release_date"].apply(
-            lambda row: (time_now - row).total_seconds()/60)
-        reviews_df_copy = reviews_df_copy[
-            reviews_df_copy["playtime_last_2_weeks"] <= reviews_df_copy["maximum_playtime_since_release"]]
-        reviews_df_copy.drop(
-            columns=["maximum_playtime_since_release", "release_date"], inplace=True)
+        release_dates = get_release_dates(conn, reviews_df["game_id"].unique().tolist())
+        # Reindexing rather than mapping leaves games without a release date as NaT,
+        # even when no game has one
+        review_release_dates = Series(release_dates.reindex(reviews_df["game_id"]).to_numpy(),
+                                      index=reviews_df.index)
+        minutes_since_release = (pd.Timestamp.now().normalize()
+                                 - review_release_dates).dt.total_seconds() / 60
+        reviews_df = reviews_df[
+            reviews_df["playtime_last_2_weeks"] <= minutes_since_release]
 
     except (Error, ValueError) as err:
         print("Error at transform: ", err)
-    return reviews_df_copy
+    return reviews_df
 
 
 def remove_empty_rows(reviews_df: DataFrame) -> DataFrame:
@@ -57,19 +50,11 @@ def change_column_types(reviews_df: DataFrame) -> DataFrame:
     for column in columns_to_numeric:
         reviews_df[column] = pd.to_numeric(reviews_df[column], errors="coerce")
         reviews_df = reviews_df.dropna(subset=[column])
-    reviews_df["last_timestamp"] = reviews_df["last_timestamp"].apply(
-        validate_time_string)
+    reviews_df["last_timestamp"] = pd.to_datetime(
+        reviews_df["last_timestamp"], unit="s", errors="coerce").dt.date
     return reviews_df
 
 
-def validate_time_string(row: str) -> date | None:
-    """Returns datetime object or None if wrong format"""
-    try:
-        return datetime.strptime(row, "%Y-%m-%d %H:%M:%S").date()
-    except (TypeError, ValueError):
-        return None
-
-
 def correct_cell_values(reviews_df: DataFrame) -> DataFrame:
     """Drops rows with invalid cell values"""
     reviews_df = reviews_df[reviews_df["review_score"] >= 0]
@@ -78,25 +63,25 @@ def correct_cell_values(reviews_df: DataFrame) -> DataFrame:
 
 
 def remove_duplicate_reviews(review_df: DataFrame) -> DataFrame:
-    """Removes duplicate rows"""
-    review_df.drop_duplicates(
-        subset=["review", "game_id", "playtime_last_2_weeks"], inplace=True)
+    """Removes duplicate rows, comparing the review fingerprints
+    from extraction rather than the review text"""
+    review_df.drop_duplicates(subset=["game_id", "review_hash"], inplace=True)
     return review_df
 
 
 def remove_unnamed(reviews_df: DataFrame) -> DataFrame:
     """Removes automatically generated unnamed column"""
-    reviews_df_copy = reviews_df.copy()
     if "Unnamed: 0" in reviews_df.columns:
-        reviews_df_copy.drop(columns="Unnamed: 0", inplace=True)
-    return reviews_df_copy
+        reviews_df.drop(columns="Unnamed: 0", inplace=True)
+    return reviews_df
 
 
-def transform_reviews(reviews_df: DataFrame) -> DataFrame:
-    """Transforms the reviews data to be valid"""
+def transform_reviews(reviews_df: DataFrame, conn: connection) -> DataFrame:
+    """Transforms the reviews data to be valid, looking up
+    release dates over the given connection"""
     reviews_df = change_column_types(reviews_df)
     reviews_df = remove_empty_rows(reviews_df)
     reviews_df = correct_cell_values(reviews_df)
     reviews_df = remove_duplicate_reviews(reviews_df)
-    reviews_df = correct_playtime(reviews_df)
+    reviews_df = correct_playtime(reviews_df, conn)
     return reviews_df
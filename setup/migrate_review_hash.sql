@@ -0,0 +1,17 @@
+-- One-off migration for a review table created before review_hash was added.
+-- Existing reviews keep a NULL review_hash: only their reviewed_at date is stored,
+-- so their fingerprint cannot be worked out again. The pipeline matches them by
+-- game, text and date instead, until they fall out of the two-week window.
+
+BEGIN;
+
+ALTER TABLE review ADD COLUMN IF NOT EXISTS review_hash BIGINT;
+
+DROP INDEX IF EXISTS review_constraint;
+
+CREATE UNIQUE INDEX review_constraint ON review (game_id, review_hash);
+
+CREATE INDEX IF NOT EXISTS review_without_hash ON review (game_id, md5(review_text))
+    WHERE review_hash IS NULL;
+
+COMMIT;
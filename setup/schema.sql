@@ -2,6 +2,8 @@
 DROP TABLE IF EXISTS game_genre_link;
 DROP TABLE IF EXISTS game_developer_link;
 DROP TABLE IF EXISTS game_publisher_link;
+DROP TABLE IF EXISTS extraction_job;
+DROP TABLE IF EXISTS review_watermark;
 DROP TABLE IF EXISTS review;
 DROP TABLE IF EXISTS genre;
 DROP TABLE IF EXISTS developer;
@@ -86,13 +88,50 @@ CREATE TABLE review(
     reviewed_at DATE NOT NULL,
     review_score INT NOT NULL DEFAULT 0,
     playtime_last_2_weeks INT NOT NULL,
+    review_hash BIGINT,
     game_id INT NOT NULL,
     PRIMARY KEY (review_id),
     FOREIGN KEY (game_id) REFERENCES game(game_id) 
 
 );
 
-CREATE UNIQUE INDEX review_constraint ON review (game_id, md5(review_text), review_score, reviewed_at, sentiment);
+-- review_hash is a 64-bit BLAKE2b fingerprint of the review's text and creation time, set at extraction.
+-- It is NULL for reviews stored before it was added (see migrate_review_hash.sql), which are
+-- matched by game, text and date instead until they age out
+
+CREATE UNIQUE INDEX review_constraint ON review (game_id, review_hash);
+
+CREATE INDEX review_without_hash ON review (game_id, md5(review_text)) WHERE review_hash IS NULL;
+
+-- review_watermark references game, holding the creation time (unix seconds) of the
+-- newest review extracted per game so incremental runs only fetch newer reviews
+
+CREATE TABLE review_watermark(
+    app_id INT NOT NULL,
+    newest_timestamp BIGINT NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (app_id),
+    FOREIGN KEY (app_id) REFERENCES game(app_id)
+
+);
+
+-- extraction_job references game, one row per game per run (a date) holding the review
+-- pager's saved position so a restarted run carries on, lease_expires_at is unix seconds
+
+CREATE TABLE extraction_job(
+    run_id TEXT NOT NULL,
+    app_id INT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts SMALLINT NOT NULL DEFAULT 0,
+    pager_state JSONB NOT NULL,
+    claimed_by TEXT,
+    lease_expires_at DOUBLE PRECISION,
+    PRIMARY KEY (run_id, app_id),
+    FOREIGN KEY (app_id) REFERENCES game(app_id)
+
+);
+
+CREATE INDEX extraction_job_status ON extraction_job (run_id, status);
 
 -- Linking tables for game with developer / publisher / genre
 